@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Process-wide cache of the parsed Question answers"""
+from __future__ import unicode_literals
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import yaml
+import yamlordereddictloader
+
+PARSED_ANSWERS_CACHE_SIZE = 2048
+"""The maximum number of Questions kept in the cache"""
+
+
+def load_answer(answer):
+    """Parse the YAML answer of a Question"""
+    return yaml.load(answer, Loader=yamlordereddictloader.Loader)
+
+
+class ParsedAnswerCache(object):
+    """
+        Least recently used cache of the parsed YAML answers, by Question id.
+
+        Each entry remembers a hash of the YAML it was parsed from, so that
+        a Question modified in another process is parsed again instead of
+        returning a stale answer.
+
+    """
+
+    def __init__(self, max_size=PARSED_ANSWERS_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, question):
+        """Get the parsed answer of a Question, parsing it if needed
+
+        The parsed answer is shared between calls, it must not be modified.
+        """
+        if question.pk is None:
+            return load_answer(question.answer)
+
+        answer = question.answer
+        if not isinstance(answer, bytes):
+            answer = answer.encode("Utf-8")
+        digest = hashlib.sha1(answer).hexdigest()
+
+        with self._lock:
+            entry = self._entries.pop(question.pk, None)
+            if entry is not None and entry[0] == digest:
+                self._entries[question.pk] = entry
+                return entry[1]
+
+        parsed = load_answer(question.answer)
+
+        with self._lock:
+            self._entries.pop(question.pk, None)
+            self._entries[question.pk] = (digest, parsed)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return parsed
+
+    def invalidate(self, question_id):
+        """Forget the parsed answer of a Question"""
+        with self._lock:
+            self._entries.pop(question_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+parsed_answers = ParsedAnswerCache()
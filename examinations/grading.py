@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Automatic grading of the responses to the Questions
+
+The answer of a Question is written in YAML (see Question.answer). To
+grade the responses, it is compiled once into a JSON structure that is
+stored with the Question (see Question.compiled_answer):
+
+    {"type": "text", "answers": ["normalized answer", ...]}
+    {"type": "math-simple", "answers": ["normalized answer", ...]}
+    {"type": "radio", "answers": [false, true, false]}
+    {"type": "checkbox", "answers": [true, false, true]}
+    {"type": "graph", "answers": [[x1, y1], [x2, y2], ...]}
+    {"type": "professor"}
+"""
+from __future__ import unicode_literals
+
+import json
+import re
+
+# Equivalence case: Replace dot by a comma:
+# Ex : 0.585 becomes 0,585
+DECIMAL_SEPARATOR = re.compile(r"(\d+).(\d*)")
+
+# Equivalence case: Delete the meaningless zeros:
+# Ex : 0,585000 becomes 0,585
+TRAILING_ZEROS = re.compile(r"^(\d+,\d*?[1-9])0+$")
+
+
+def normalize_text(value):
+    """Normalize a text answer: lower case, without spaces"""
+    if isinstance(value, bytes):
+        value = value.decode("Utf-8")
+    return unicode(value).lower().strip().replace(" ", "")
+
+
+def normalize_math(value):
+    """Normalize a math answer of a Student, see normalize_text"""
+    value = normalize_text(value)
+    value = DECIMAL_SEPARATOR.sub(r"\1,\2", value)
+    return TRAILING_ZEROS.sub(r"\1", value)
+
+
+def compile_answer(answer):
+    """Compile the parsed answer of a Question (its type and its answers)
+
+    :param answer: The answer, as returned by Question.get_answer
+    :type answer: dict
+    :returns: The compiled answer, JSON serializable
+    :rtype: dict
+    """
+    evaluation_type = answer["type"]
+
+    if evaluation_type == "text" or evaluation_type.startswith("math"):
+        return {
+            "type": evaluation_type,
+            "answers": [normalize_text(x) for x in answer["answers"]],
+        }
+
+    elif evaluation_type in ("radio", "checkbox"):
+        return {
+            "type": evaluation_type,
+            "answers": [bool(x) for x in answer["answers"].values()],
+        }
+
+    elif evaluation_type == "graph":
+        return {
+            "type": evaluation_type,
+            "answers": [[x["graph"]["coordinates"]["X"], x["graph"]["coordinates"]["Y"]] for x in answer["answers"]],
+        }
+
+    return {"type": evaluation_type}
+
+
+def first_response(response):
+    """The Student answers a text, math or radio question with a single value"""
+    if isinstance(response, (list, tuple)):
+        return response[0] if response else None
+    return response
+
+
+def grader(compiled_answer):
+    """Get a function grading the responses against the compiled answer of a Question
+
+    The correct answers are prepared once (as sets) for all the responses graded.
+
+    :param compiled_answer: The compiled answer, see compile_answer
+    :returns: A function taking a response, returning 1 if it is correct, 0 if incorrect,
+              -1 if automatic evaluation is impossible
+    """
+    evaluation_type = compiled_answer["type"]
+
+    if evaluation_type == "text":
+        correct_answers = frozenset(compiled_answer["answers"])
+
+        def grade_text(response):
+            response = first_response(response)
+            if response is None:
+                return 0
+            return 1 if normalize_text(response) in correct_answers else 0
+
+        return grade_text
+
+    elif evaluation_type.startswith("math"):
+        correct_answers = frozenset(compiled_answer["answers"])
+
+        def grade_math(response):
+            response = first_response(response)
+            if response is None:
+                return 0
+            return 1 if normalize_math(response) in correct_answers else 0
+
+        return grade_math
+
+    elif evaluation_type == "radio":
+        answers = tuple(compiled_answer["answers"])
+
+        def grade_radio(response):
+            response = first_response(response)
+
+            # If no selected answer, or if the selected answer is not part of the list
+            if not isinstance(response, int) or not 0 <= response < len(answers):
+                return 0
+            return 1 if answers[response] else 0
+
+        return grade_radio
+
+    elif evaluation_type == "checkbox":
+        number_of_checkboxes = len(compiled_answer["answers"])
+        correct = frozenset(number for number, is_correct in enumerate(compiled_answer["answers"]) if is_correct)
+
+        def grade_checkbox(response):
+            selected = {x for x in response if isinstance(x, int) and 0 <= x < number_of_checkboxes}
+
+            # All the correct answers are selected, all the incorrect ones not selected
+            return 1 if selected == correct else 0
+
+        return grade_checkbox
+
+    elif evaluation_type == "graph":
+        correct_answers = [tuple(x) for x in compiled_answer["answers"]]
+
+        def grade_graph(response):
+            remaining_answers = list(correct_answers)
+
+            for point in response:
+                try:
+                    coordinates = (int(point["coordinates"]["X"]), int(point["coordinates"]["Y"]))
+                except (KeyError, TypeError, ValueError):
+                    return 0
+
+                if coordinates not in remaining_answers:
+                    return 0
+                remaining_answers.remove(coordinates)
+
+            return 1
+
+        return grade_graph
+
+    # No automatic verification to perform if corrected by a Professor,
+    # or no automatic correction type found, not corrected by default
+    return lambda response: -1
+
+
+def grade(compiled_answer, response):
+    """Grades a response against the compiled answer of a Question
+
+    :param compiled_answer: The compiled answer, see compile_answer
+    :param response: The response to assess
+    :type response: array
+    :returns: 1 if the response is correct, 0 if incorrect, -1 if automatic evaluation is impossible
+    :rtype: int
+    """
+    return grader(compiled_answer)(response)
+
+
+def grade_batch(question, responses):
+    """Grades a list of responses to the same Question
+
+    :param question: The Question answered
+    :type question: examinations.models.Question
+    :param responses: The responses to assess
+    :type responses: list
+    :returns: The grades, in the order of the responses (see grade)
+    :rtype: list
+    """
+    grade_response = grader(question.get_compiled_answer())
+    return [grade_response(response) for response in responses]
+
+
+def load_responses(raw_answer):
+    """The graded responses of an Answer, by question index (see Answer.raw_answer)
+
+    The Answers saved before raw_answer was stored as JSON contain a JSON
+    encoded string, decoded here until converted (see convert_raw_answers).
+
+    :rtype: dict
+    """
+    if isinstance(raw_answer, basestring):
+        raw_answer = json.loads(raw_answer)
+
+    return raw_answer[0]
+
+
+def evaluate_responses(responses):
+    """Determines if all the responses to the Questions of a Context are correct
+
+    :param responses: The graded responses, by question index (see Answer.get_answers)
+    :type responses: dict
+    :return: -1 if not all the questions are graded, 1 if all the responses are correct,
+            0 if there is at least one mistake
+    :rtype: int
+    """
+    for response in responses.values():
+        if response["correct"] == -1:
+            return -1
+        elif response["correct"] != 1:
+            return 0
+    return 1
+
+
+def count_pending(responses):
+    """Count the responses waiting for the assessment of a Professor (see grader)
+
+    :param responses: The graded responses, by question index (see Answer.get_answers)
+    :rtype: int
+    """
+    return sum(1 for response in responses.values() if response["correct"] == -1)
+
+
+RESPONSE_COUNTERS = {1: "correct", 0: "incorrect", -1: "pending"}
+"""The counter of QuestionStats incremented by each correction value"""
+
+
+def count_responses(question_ids, responses, counts=None, sign=1):
+    """Count the responses of an Answer by Question and by correction
+
+    :param question_ids: The ids of the Questions of the Context, by question index
+    :param responses: The graded responses, by question index (see Answer.get_answers)
+    :param counts: The counts to add to, a new dict by default
+    :param sign: 1 to add the responses, -1 to remove them
+    :returns: The counts {question_id: {"attempts": ..., "correct": ..., ...}}, only the non zero ones
+    :rtype: dict
+    """
+    if counts is None:
+        counts = {}
+
+    for index, question_id in enumerate(question_ids):
+        response = responses.get(str(index))
+        if response is None:
+            continue
+
+        question_counts = counts.setdefault(question_id, {})
+        for field in ("attempts", RESPONSE_COUNTERS[int(response["correct"])]):
+            question_counts[field] = question_counts.get(field, 0) + sign
+
+    return counts
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Recording of the results grids filled by the Professors, for the TestFromClass and the hybrid Tests"""
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+from django.db import transaction
+
+from skills.models import Skill
+from skills.propagation import SkillPropagation
+from users.models import Student
+
+from .models import Answer, TestExercice, TestSkillFromClass, TestStudent
+
+GRID_RESULTS = ("good", "bad", "unknown")
+"""The results of a cell of a grid"""
+
+
+def parse_grid(values):
+    """Parse the cells of a results grid, "<result>_<student id>_<row id>"
+
+    The other values are ignored. When a (Student, row) pair is given
+    several times, its last result wins.
+
+    :param values: The POSTed values of the grid
+    :returns: The (result, student id, row id) of the cells
+    :rtype: list
+    """
+    cells = OrderedDict()
+    for value in values:
+        if not value.startswith(GRID_RESULTS):
+            continue
+
+        result, student_id, row_id = value.split("_", 2)
+        key = (int(student_id), int(row_id))
+
+        cells.pop(key, None)
+        cells[key] = result
+
+    return [(result, student_id, row_id) for (student_id, row_id), result in cells.items()]
+
+
+def _check_known(kind, ids, known):
+    """Raise a ValueError if some ids of a grid are not known"""
+    unknown = set(ids) - set(known)
+    if unknown:
+        raise ValueError("Unknown %s: %s" % (kind, ", ".join(str(x) for x in sorted(unknown))))
+
+
+def propagate_results(propagation, results, reason):
+    """
+    Collect the changes of the StudentSkills for the results of a grid.
+
+    The Skills of the "good" and "bad" cells are set again at the end, with
+    a "second pass" SkillHistory: the propagation of a cell may change a
+    Skill of another cell of the same Student, and the resulting Skills
+    have to match the Professor input.
+
+    :param results: The (result, student id, skill id, reason object) of the cells
+    """
+    for result, student_id, skill_id, reason_object in results:
+        if result == "good":
+            propagation.validate(student_id, skill_id, reason, reason_object)
+        elif result == "bad":
+            propagation.unvalidate(student_id, skill_id, reason, reason_object)
+
+    # the last change of a StudentSkill wins, see SkillPropagation
+    for result, student_id, skill_id, reason_object in results:
+        if result not in ("good", "bad"):
+            continue
+
+        propagation.set_value(student_id, (skill_id,), "acquired" if result == "good" else "not acquired",
+                              "%s (seconde passe)" % reason, reason_object)
+
+
+def fill_test_from_class(test_from_class, cells, who):
+    """
+    Record the results of the grid of a TestFromClass, with a few statements whatever its size.
+
+    :param cells: The (result, student id, skill id) of the cells, see parse_grid
+    :param who: The User filling the grid
+    """
+    student_ids = {student_id for _, student_id, _ in cells}
+    skill_ids = {skill_id for _, _, skill_id in cells}
+
+    with transaction.atomic():
+        _check_known("Students", student_ids, Student.objects.filter(pk__in=student_ids).values_list("id", flat=True))
+        _check_known("Skills", skill_ids, Skill.objects.filter(pk__in=skill_ids).values_list("id", flat=True))
+
+        existing = {
+            (student_id, skill_id): pk for pk, student_id, skill_id in TestSkillFromClass.objects.filter(
+                test=test_from_class, student__in=student_ids, skill__in=skill_ids).values_list(
+                "id", "student_id", "skill_id")
+        }
+
+        by_result = {}
+        to_create = []
+        for result, student_id, skill_id in cells:
+            if (student_id, skill_id) in existing:
+                by_result.setdefault(result, []).append(existing[(student_id, skill_id)])
+            else:
+                to_create.append(TestSkillFromClass(
+                    test=test_from_class, student_id=student_id, skill_id=skill_id, result=result))
+
+        propagation = SkillPropagation(who)
+        propagation.prefetch(student_ids)
+        propagation.prefetch_curricula(student_ids)
+
+        propagate_results(propagation, [
+            (result, student_id, skill_id, test_from_class) for result, student_id, skill_id in cells
+        ], "Évaluation libre")
+
+        for result, pks in by_result.items():
+            TestSkillFromClass.objects.filter(pk__in=pks).update(result=result)
+        TestSkillFromClass.objects.bulk_create(to_create)
+
+        propagation.save()
+
+
+def insert_hybrid_results(test, cells, who):
+    """
+    Record the results of the offline exercices of a hybrid Test, with a few statements whatever its size.
+
+    Each cell gets an Answer (from_test_hybride), the reason of its
+    SkillHistory. These Answers have no raw_answer: the bulk creation skips
+    their post_save receivers, which would have nothing to count.
+
+    :param cells: The (result, student id, test exercice id) of the cells, see parse_grid
+    :param who: The User filling the grid
+    """
+    student_ids = {student_id for _, student_id, _ in cells}
+    test_exercice_ids = {test_exercice_id for _, _, test_exercice_id in cells}
+
+    with transaction.atomic():
+        test_students = dict(TestStudent.objects.filter(test=test, student__in=student_ids).values_list(
+            "student_id", "id"))
+        skills = dict(TestExercice.objects.filter(test=test, pk__in=test_exercice_ids).values_list("id", "skill_id"))
+
+        _check_known("Students", student_ids, test_students)
+        _check_known("TestExercices", test_exercice_ids, skills)
+
+        answers = {
+            (answer.test_student_id, answer.test_exercice_id): answer for answer in Answer.objects.filter(
+                from_test_hybride=True, test_student__in=test_students.values(), test_exercice__in=skills)
+        }
+
+        to_create = []
+        for _, student_id, test_exercice_id in cells:
+            key = (test_students[student_id], test_exercice_id)
+            if key not in answers:
+                answers[key] = Answer(from_test_hybride=True, test_student_id=key[0], test_exercice_id=key[1])
+                to_create.append(answers[key])
+
+        Answer.objects.bulk_create(to_create)
+
+        propagation = SkillPropagation(who)
+        propagation.prefetch(student_ids)
+        propagation.prefetch_curricula(student_ids)
+
+        propagate_results(propagation, [
+            (result, student_id, skills[test_exercice_id], answers[(test_students[student_id], test_exercice_id)])
+            for result, student_id, test_exercice_id in cells
+        ], "Exercice hors lignes pour un test hybride")
+
+        propagation.save()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Func
+
+from examinations.answer_cache import load_answer
+from examinations.grading import compile_answer
+from examinations.models import Question
+
+
+class Command(BaseCommand):
+
+    help = "Compile the YAML answer of the Questions for the automatic grading (fills Question.compiled_answer), " \
+           "when it changed since it was compiled"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", dest="all", default=False,
+                            help="Compile again the Questions already compiled")
+
+    def handle(self, *args, **options):
+        questions = Question.objects.exclude(answer="")
+        if not options["all"]:
+            # the answers modified without Question.save, in the database directly or by a queryset update
+            questions = questions.exclude(compiled_answer__isnull=False,
+                                          compiled_answer_digest=Func(F("answer"), function="md5"))
+
+        compiled, failed = 0, 0
+        with transaction.atomic():
+            for question_id, answer in questions.values_list("id", "answer").iterator():
+                try:
+                    compiled_answer = compile_answer(load_answer(answer))
+                except Exception as e:
+                    self.stderr.write("Question %s: the answer cannot be compiled (%s)" % (question_id, e))
+                    failed += 1
+                    continue
+
+                Question.objects.filter(pk=question_id).update(
+                    compiled_answer=compiled_answer, compiled_answer_digest=Question.answer_digest(answer))
+                compiled += 1
+
+        self.stdout.write("%s Questions compiled, %s failed" % (compiled, failed))
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from examinations.models import Answer
+
+
+class Command(BaseCommand):
+
+    help = "Store as JSON the raw_answer of the Answers saved as a JSON encoded string"
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            # decoded by Postgres: the string is read as text (#>> '{}') and parsed again
+            cursor.execute(
+                'UPDATE "{table}" SET "raw_answer" = ("raw_answer" #>> \'{{}}\')::jsonb '
+                'WHERE jsonb_typeof("raw_answer") = \'string\''.format(table=Answer._meta.db_table)
+            )
+            converted = cursor.rowcount
+
+        self.stdout.write("%s Answers converted" % converted)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from examinations.grading import count_pending, load_responses
+from examinations.models import Answer, Test, TestStudent
+
+
+def sum_of(queryset, group_by):
+    """The sum of pending_professor_review of the rows of queryset, for each row of the outer query"""
+    return Coalesce(Subquery(
+        queryset.filter(**{group_by: OuterRef("pk")}).values(group_by).annotate(
+            total=Sum("pending_professor_review")).values("total")[:1],
+        output_field=IntegerField(),
+    ), 0)
+
+
+class Command(BaseCommand):
+
+    help = "Count again the responses waiting for the assessment of a Professor, by Answer, TestStudent and Test " \
+           "(run convert_raw_answers before)"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            Answer.objects.exclude(pending_professor_review=0).update(pending_professor_review=0)
+
+            counted = 0
+            for answer_id, raw_answer in Answer.objects.to_assess().values_list("id", "raw_answer").iterator():
+                Answer.objects.filter(pk=answer_id).update(
+                    pending_professor_review=count_pending(load_responses(raw_answer)))
+                counted += 1
+
+            TestStudent.objects.update(pending_professor_review=sum_of(Answer.objects.all(), "test_student"))
+            Test.objects.update(pending_professor_review=sum_of(TestStudent.objects.all(), "test"))
+
+        self.stdout.write("%s Answers to assess" % counted)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from examinations.models import List_question
+
+
+class Command(BaseCommand):
+
+    help = "Number the Questions of each Context (List_question.position) in the order of their ids, " \
+           "the order the responses of the Answers were given in"
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE "{table}" SET "position" = "ranks"."rank" FROM ('
+                'SELECT "id", ROW_NUMBER() OVER (PARTITION BY "context_id" ORDER BY "question_id") - 1 AS "rank" '
+                'FROM "{table}") AS "ranks" '
+                'WHERE "{table}"."id" = "ranks"."id"'.format(table=List_question._meta.db_table)
+            )
+            numbered = cursor.rowcount
+
+        self.stdout.write("%s Questions numbered" % numbered)
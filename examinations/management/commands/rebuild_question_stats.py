@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from examinations.models import QuestionStats, QUESTION_STATS_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+
+    help = "Count again from scratch the responses to the Questions (QuestionStats) in all the Answers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", dest="chunk_size", default=QUESTION_STATS_CHUNK_SIZE, type=int,
+                            help="The number of Answers read together")
+
+    def handle(self, *args, **options):
+        def progress(counted, total):
+            self.stdout.write("%s/%s Answers counted" % (counted, total))
+
+        QuestionStats.rebuild(chunk_size=options["chunk_size"], progress=progress)
+
+        self.stdout.write("%s Questions counted" % QuestionStats.objects.count())
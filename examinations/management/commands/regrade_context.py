@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from examinations.models import Context
+from examinations.regrade import regrade_context, REGRADE_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+
+    help = "Grade again all the Answers to a Context, after its Questions have been modified"
+
+    def add_arguments(self, parser):
+        parser.add_argument("context_id", type=int, help="The Context to grade again")
+        parser.add_argument("--dry-run", action="store_true", dest="dry_run", default=False,
+                            help="Only report the number of changed verdicts")
+        parser.add_argument("--chunk-size", dest="chunk_size", default=REGRADE_CHUNK_SIZE, type=int,
+                            help="The number of Answers graded together")
+
+    def handle(self, *args, **options):
+        context = Context.objects.filter(pk=options["context_id"]).first()
+        if context is None:
+            raise CommandError("Context %s does not exist" % options["context_id"])
+
+        who = User.objects.filter(is_superuser=True).order_by("id").first()
+        if who is None and not options["dry_run"]:
+            raise CommandError("A superuser is needed to record the changes of the StudentSkills")
+
+        def progress(graded, total):
+            self.stdout.write("%s/%s Answers graded" % (graded, total))
+
+        result = regrade_context(context, who, dry_run=options["dry_run"], chunk_size=options["chunk_size"],
+                                 progress=progress)
+
+        self.stdout.write("%s verdicts changed in %s Answers, %s StudentSkills %s" % (
+            result.changed_verdicts,
+            result.changed_answers,
+            result.changed_skills,
+            "to update" if options["dry_run"] else "updated",
+        ))
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from examinations.models import Context
+from examinations.regrade import regrade_context
+
+
+class Command(BaseCommand):
+
+    help = "Grade again the Answers to the Contexts whose Questions have been modified online (run by cron)"
+
+    def handle(self, *args, **options):
+        pending = Context.objects.filter(regrade_requested_by__isnull=False).order_by("modified_at").values_list(
+            "id", "regrade_requested_by")
+
+        for context_id, who_id in pending:
+            # cleared before grading: a modification made meanwhile asks for another pass
+            if not Context.objects.filter(pk=context_id, regrade_requested_by=who_id).update(
+                    regrade_requested_by=None):
+                continue
+
+            result = regrade_context(Context.objects.get(pk=context_id), User.objects.get(pk=who_id))
+
+            self.stdout.write("Context %s: %s verdicts changed in %s Answers, %s StudentSkills updated" % (
+                context_id, result.changed_verdicts, result.changed_answers, result.changed_skills))
@@ -1,16 +1,33 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
-from django.db import models
-from django.contrib.postgres.fields import JSONField
+from django.db import models, transaction
+from django.db.models import Case, F, Func, Value, When
+from django.contrib.postgres.fields import ArrayField, JSONField
 from datetime import datetime
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-import yaml
-import yamlordereddictloader
-import json
-import re
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+import hashlib
+import random
+from itertools import islice
+
+from skills.equivalence import get_skill_equivalence
+from skills.graph import get_skill_graph
+
+from .answer_cache import parsed_answers
+from .grading import compile_answer, grade, evaluate_responses, count_responses, count_pending, load_responses
+
+
+class ContextQuerySet(models.QuerySet):
+
+    def for_skill_equivalents(self, skill):
+        """The Contexts of a Skill and of the Skills identical to it (see skills.equivalence)"""
+        skill_id = getattr(skill, "pk", skill)
+        return self.filter(skill__in=get_skill_equivalence().identic_skills(skill_id))
 
 
 class Context(models.Model):
@@ -42,16 +59,24 @@ class Context(models.Model):
     file_name = models.CharField(max_length=255, null=True, blank=True)
     """\"submitted\" if created online, \"adapted\" if modified for a Test,
         \"a_file_name\" if the exercise is stored in a file (method not used anymore)"""
+    regrade_requested_by = models.ForeignKey(User, null=True, blank=True, related_name="+")
+    """The Professor whose modification of the Questions waits for the Answers to be graded again,
+        None if there is nothing to grade again (see the regrade_pending_contexts command)"""
+
+    objects = ContextQuerySet.as_manager()
 
     def get_questions(self):
-        """Get all the questions attached to this Context."""
-        list_questions = list()
-        questions = list()
-        for list_question in List_question.objects.filter(context=self.id):
-            list_questions.append(list_question.question.id)
-        for question in Question.objects.filter(id__in=list_questions):
-            questions.append(question)
-        return questions
+        """Get all the questions attached to this Context, in order (see List_question.position)
+
+        The responses of an Answer are numbered in this order. Use
+        prefetch_questions to load the questions of several Contexts at once.
+        """
+        if "list_question_set" in getattr(self, "_prefetched_objects_cache", {}):
+            list_questions = self.list_question_set.all()
+        else:
+            list_questions = self.list_question_set.select_related("question")
+
+        return [list_question.question for list_question in list_questions]
 
 
 class List_question(models.Model):
@@ -65,6 +90,20 @@ class List_question(models.Model):
     """A Context"""
     question = models.ForeignKey('Question')
     """A Question"""
+    position = models.PositiveIntegerField(default=0)
+    """The rank of the Question in the Context, from 0"""
+
+    class Meta:
+        ordering = ("position", "question")
+
+
+def prefetch_questions(lookup="list_question_set"):
+    """Prefetch the questions of Contexts in a single query, for Context.get_questions
+
+    :param lookup: The path to the list_question_set of the Contexts, as
+        "test_exercice__exercice__list_question_set" for Answers
+    """
+    return models.Prefetch(lookup, queryset=List_question.objects.select_related("question"))
 
 
 class Question(models.Model):
@@ -85,12 +124,28 @@ class Question(models.Model):
     """Source(s) needed to create the question"""
     indication = models.CharField(max_length=255, null=True, blank=True)
     """Indication/Commentary only visible to the Professor"""
+    compiled_answer = JSONField(null=True, blank=True)
+    """The answer compiled from the YAML for the automatic grading, see examinations.grading.
+        Compiled again whenever the answer changes, see compiled_answer_digest."""
+    compiled_answer_digest = models.CharField(max_length=32, null=True, blank=True)
+    """The digest (see answer_digest) of the answer compiled_answer was compiled from"""
+
+    @staticmethod
+    def answer_digest(answer):
+        """The MD5 of a YAML answer, the same as the md5() of PostgreSQL"""
+        if not isinstance(answer, bytes):
+            answer = answer.encode("Utf-8")
+        return hashlib.md5(answer).hexdigest()
 
     def get_answer(self):
-        """Get the type and the correct answers in the YAML format"""
+        """Get the type and the correct answers in the YAML format
+
+        The YAML is parsed once per version of the Question and shared
+        between calls: the result must not be modified.
+        """
         # Load YAML answer
         if self.answer:
-            return yaml.load(self.answer, Loader=yamlordereddictloader.Loader)
+            return parsed_answers.get(self)
 
         return {}
 
@@ -121,6 +176,27 @@ class Question(models.Model):
             coordinates.append((x, y))
         return coordinates
 
+    def get_compiled_answer(self):
+        """Get the type and the correct answers compiled for the grading, see examinations.grading
+
+        Compiled again when the answer changed since it was compiled.
+        """
+        digest = Question.answer_digest(self.answer)
+        if self.compiled_answer is None or self.compiled_answer_digest != digest:
+            self.compiled_answer = compile_answer(self.get_answer())
+            self.compiled_answer_digest = digest
+
+        return self.compiled_answer
+
+    def save(self, *args, **kwargs):
+        # The compiled answer is derived from the YAML answer, which stays the editable source
+        if self.answer:
+            self.get_compiled_answer()
+        else:
+            self.compiled_answer = self.compiled_answer_digest = None
+
+        super(Question, self).save(*args, **kwargs)
+
     def evaluate(self, response):
         """Evaluates this Question with the provided response
 
@@ -129,101 +205,184 @@ class Question(models.Model):
         :returns: 1 if the response is correct, 0 if incorrect, -1 if automatic evaluation is impossible
         :rtype: int
         """
-        raw_correct_answers = self.get_answer()
-        evaluation_type = raw_correct_answers["type"]
-        if evaluation_type == "text":
-            # We only need the first and only element: the text by the Student
-            response = response[0]
-            if isinstance(response, (int, float)):
-                response = str(response)
-
-            correct_answers = [unicode(x).lower().strip().replace(" ", "").encode('UTF-8')
-                               for x in raw_correct_answers["answers"]]
-            response = response.strip().replace(" ", "").lower().encode("Utf-8") if isinstance(response,
-                                                                                           basestring) else response
-
-            if response in [x for x in correct_answers]:
-                return 1
-            else:
-                return 0
-
-        elif evaluation_type.startswith("math"):
-            # We only need the first and only element: the math formula by the Student
-            response = response[0]
-
-            correct_answers = [unicode(x).lower().strip().replace(" ", "").encode("Utf-8")
-                               for x in raw_correct_answers["answers"]]
-            response = response.strip().replace(" ", "").lower().encode("Utf-8") if isinstance(response,
-                                                                                               basestring) else response
-            # Equivalence case: Replace dot by a comma:
-            # Ex : 0.585 becomes 0,585
-            response = re.sub(r"(\d+).(\d*)", r"\1,\2", response)
-
-            # Equivalence case: Delete the meaningless zeros:
-            # Ex : 0,585000 becomes 0,585
-            response = re.sub(r"^(\d+,\d*?[1-9])0+$", r"\1", response)
-
-            if response in [x for x in correct_answers]:
-                return 1
-            else:
-                return 0
-
-        elif evaluation_type == "radio":
-            # We only need the first and only element: the answer selected by the Student
-            response = response[0]
-
-            # The list of correct/incorrect answers
-            answers = raw_correct_answers["answers"]
-
-            # If no selected answer
-            if response == -1:
-                return 0
-            # If the selected answer is not part of the list, should not be possible for a Student
-            elif response > len(raw_correct_answers.values()):
-                return 0
-            # If the selected answer is True (correct)
-            elif answers.values()[response]:
-                return 1
-            # Else, a false answer has been selected by the Student
-            else:
-                return 0
-
-        elif evaluation_type == "graph":
-            student_answers = list()
-            for elem in response:
-                student_answers.append(elem["coordinates"])
-
-            number_good_answers = 0
-            for elem1 in student_answers:
-                for elem2 in raw_correct_answers["answers"]:
-                    if int(elem1["Y"]) == elem2["graph"]["coordinates"]["Y"] and int(elem1["X"]) == elem2["graph"]["coordinates"]["X"]:
-                        raw_correct_answers["answers"].remove(elem2)
-                        number_good_answers += 1
-
-            if number_good_answers == len(student_answers):
-                return 1
-            else:
-                return 0
-
-        elif evaluation_type == "checkbox":
-            # The list of correct/incorrect answers
-            answers = raw_correct_answers["answers"]
-
-            for checkbox_number, is_correct in enumerate(answers.values()):
-                if is_correct and checkbox_number not in response:
-                    return 0
-                if not is_correct and checkbox_number in response:
-                    return 0
-            # All the correct answers are selected, all the incorrect ones not selected
-            return 1
-
-        elif evaluation_type == "professor":
-            # No automatic verification to perform if corrected by a Professor
-            return -1
-
-        # No automatic correction type found, not corrected by default
-        else:
-            return -1
+        return grade(self.get_compiled_answer(), response)
+
+
+QUESTION_STATS_CHUNK_SIZE = 1000
+"""The number of Answers read together when counting the responses to the Questions"""
+
+
+class QuestionStats(models.Model):
+    """
+        The number of responses to a Question, correct, incorrect or not
+        assessed yet by a Professor.
+
+        Materialized from the raw_answer of the Answers to find the hardest
+        Questions without reading all of them. The counters are updated with
+        each new, assessed, graded again or deleted Answer.
+
+    """
+
+    question = models.OneToOneField(Question, related_name="stats")
+    """The Question"""
+    attempts = models.PositiveIntegerField(default=0)
+    """The number of responses to the Question"""
+    correct = models.PositiveIntegerField(default=0)
+    """The number of correct responses"""
+    incorrect = models.PositiveIntegerField(default=0)
+    """The number of incorrect responses"""
+    pending = models.PositiveIntegerField(default=0)
+    """The number of responses waiting for the assessment of a Professor"""
+
+    def __unicode__(self):
+        return u"%s" % self.question
+
+    def get_success_rate(self):
+        """The part of the assessed responses being correct, None without assessed response"""
+        total = self.correct + self.incorrect
+
+        if total == 0:
+            return None
+
+        return float(self.correct) / total
+
+    @staticmethod
+    def question_ids(context_ids):
+        """The ids of the Questions of some Contexts, by Context id, in the order of the indexes of the responses
+
+        The responses of an Answer are numbered as the Questions of the Context, see Context.get_questions
+        """
+        question_ids = {}
+        for context_id, question_id in List_question.objects.filter(context__in=context_ids).order_by(
+                "context", "position", "question").values_list("context_id", "question_id"):
+            question_ids.setdefault(context_id, []).append(question_id)
+
+        return question_ids
+
+    @classmethod
+    def aggregate(cls, question_ids=None, chunk_size=QUESTION_STATS_CHUNK_SIZE, progress=None):
+        """Count the responses of all the Answers, for some Questions or all of them
+
+        The Answers are read in chunks through a server-side cursor, their
+        raw_answer is parsed once and dropped.
+
+        :param progress: A function called with (counted, total) after each chunk
+        :returns: The counts by Question id (see count_responses)
+        :rtype: dict
+        """
+        answers = Answer.objects.filter(test_exercice__exercice__isnull=False, raw_answer__isnull=False)
+        if question_ids is not None:
+            question_ids = set(question_ids)
+            answers = answers.filter(test_exercice__exercice__list_question__question__in=question_ids).distinct()
+
+        contexts = cls.question_ids(answers.values("test_exercice__exercice"))
+
+        total = answers.count()
+        rows = answers.values_list("test_exercice__exercice_id", "raw_answer").iterator()
+
+        counts, counted = {}, 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            for context_id, raw_answer in chunk:
+                count_responses(contexts.get(context_id, []), load_responses(raw_answer), counts)
+
+            counted += len(chunk)
+            if progress is not None:
+                progress(counted, total)
+
+        if question_ids is not None:
+            counts = {x: counts[x] for x in question_ids if x in counts}
+
+        return counts
+
+    @classmethod
+    def refresh(cls, question_ids):
+        """Count again the responses to some Questions"""
+        counts = cls.aggregate(question_ids)
+
+        with transaction.atomic():
+            for question_id in question_ids:
+                question_counts = counts.get(question_id, {})
+                cls.objects.update_or_create(question_id=question_id, defaults={
+                    field: question_counts.get(field, 0) for field in ("attempts", "correct", "incorrect", "pending")
+                })
+
+    @classmethod
+    def rebuild(cls, chunk_size=QUESTION_STATS_CHUNK_SIZE, progress=None):
+        """Count again from scratch the responses to all the Questions"""
+        counts = cls.aggregate(chunk_size=chunk_size, progress=progress)
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create([
+                cls(question_id=question_id, **question_counts)
+                for question_id, question_counts in counts.items()
+            ], batch_size=QUESTION_STATS_CHUNK_SIZE)
+
+    @classmethod
+    def apply(cls, counts):
+        """Add the counts of some changed responses to the counters (see count_responses)
+
+        The changes must already be saved: a Question without counters yet
+        gets its responses counted from scratch, locked not to be counted by
+        two transactions at once.
+        """
+        updates = {}
+        for question_id, question_counts in counts.items():
+            delta = tuple(sorted((field, number) for field, number in question_counts.items() if number))
+            if delta:
+                updates.setdefault(delta, []).append(question_id)
+
+        if not updates:
+            return
+
+        with transaction.atomic():
+            missing = set(counts) - set(cls.objects.filter(question__in=counts).values_list("question_id", flat=True))
+
+            if missing:
+                # locked before counting: the counters created meanwhile by a concurrent transaction get the changes
+                list(Question.objects.select_for_update().filter(pk__in=missing).order_by("pk").values_list(
+                    "pk", flat=True))
+                missing -= set(cls.objects.filter(question__in=missing).values_list("question_id", flat=True))
+
+            # the same changes of the counters are made with a single UPDATE
+            for delta, question_ids in updates.items():
+                cls.objects.filter(question__in=question_ids).update(
+                    **{field: F(field) + number for field, number in delta})
+
+            # counted with the changes, already saved
+            if missing:
+                cls.refresh(missing)
+
+    @classmethod
+    def apply_answer(cls, answer, sign=1):
+        """Add (or remove, with sign=-1) the responses of an Answer to the counters"""
+        # not through answer.test_exercice, already deleted when deleting a Test
+        context_id = TestExercice.objects.filter(pk=answer.test_exercice_id).values_list(
+            "exercice_id", flat=True).first()
+
+        if answer.raw_answer is None or context_id is None:
+            return
+
+        question_ids = cls.question_ids([context_id]).get(context_id, [])
+        cls.apply(count_responses(question_ids, answer.get_answers(), sign=sign))
+
+
+class AnswerQuerySet(models.QuerySet):
+
+    def to_assess(self):
+        """The Answers with at least one response not assessed yet by a Professor, read from their raw_answer
+
+        Only the responses to professor-type Questions are not graded automatically (see grader).
+        Only used to compute Answer.pending_professor_review, filter on this counter elsewhere.
+        """
+        return self.extra(where=["""EXISTS (
+            SELECT 1 FROM jsonb_each("{table}"."raw_answer" -> 0) AS response
+            WHERE response.value -> 'correct' = '-1'
+        )""".format(table=self.model._meta.db_table)])
 
 
 class Answer(models.Model):
@@ -235,8 +394,9 @@ class Answer(models.Model):
 
     """
 
-    raw_answer = JSONField(null=True, blank=True)  # let's store json
-    """The answers the student provided to all the Question(s) belonging to a Context"""
+    raw_answer = JSONField(null=True, blank=True)
+    """The answers the student provided to all the Question(s) belonging to a Context,
+        [{"question index": {"response": ..., "correct": 1, 0 or -1 if not corrected yet}}]"""
     from_test_hybride = models.BooleanField(default=False)
     """Depreciated"""
     automatic = models.BooleanField(default=False)
@@ -248,6 +408,48 @@ class Answer(models.Model):
     """The TestExercice (which Context in the test) corresponding to our answers"""
     answer_datetime = models.DateTimeField(auto_now_add=True)
     """The date we submitted our answers"""
+    pending_professor_review = models.PositiveSmallIntegerField(default=0, db_index=True)
+    """The number of responses waiting for the assessment of a Professor, computed from raw_answer when saved"""
+
+    objects = AnswerQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Answer, cls).from_db(db, field_names, values)
+        # remember the number loaded, to report its change to the TestStudent and the Test when saved
+        if "pending_professor_review" not in instance.get_deferred_fields():
+            instance._loaded_pending = instance.pending_professor_review
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.pending_professor_review = count_pending(self.get_answers()) if self.raw_answer is not None else 0
+        super(Answer, self).save(*args, **kwargs)
+
+    @staticmethod
+    def roll_up_pending(deltas):
+        """Report the changes of the number of responses to assess of some Answers to their TestStudent and Test
+
+        :param deltas: The changes, by TestStudent id
+        """
+        deltas = {test_student_id: delta for test_student_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+
+        test_deltas = {}
+        for test_student_id, test_id in TestStudent.objects.filter(pk__in=deltas).values_list("id", "test_id"):
+            test_deltas[test_id] = test_deltas.get(test_id, 0) + deltas[test_student_id]
+
+        with transaction.atomic():
+            for model, model_deltas in ((TestStudent, deltas), (Test, test_deltas)):
+                # the same change of the counter is made with a single UPDATE
+                by_delta = {}
+                for pk, delta in model_deltas.items():
+                    if delta:
+                        by_delta.setdefault(delta, []).append(pk)
+
+                for delta, pks in by_delta.items():
+                    model.objects.filter(pk__in=pks).update(
+                        pending_professor_review=F("pending_professor_review") + delta)
 
     def get_questions_with_answers(self):
         """Get the Answer and the Questions linked with it
@@ -255,17 +457,16 @@ class Answer(models.Model):
         :returns: The questions with the answers: (index, question, type, response, correct)
         :rtype: list
         """
+        answers = self.get_answers()
         questions_with_answers = list()
-        index = 0
-        for question in self.test_exercice.exercice.get_questions():
+        for index, question in enumerate(self.test_exercice.exercice.get_questions()):
             questions_with_answers.append(
                 [index,
                  question,
                  question.get_type(),
-                 self.get_answers()[str(index)].get("response"),
-                 self.get_answers()[str(index)].get("correct")
+                 answers[str(index)].get("response"),
+                 answers[str(index)].get("correct")
                  ])
-            index += 1
         return questions_with_answers
 
     def contains_professor_not_assessed(self):
@@ -274,11 +475,8 @@ class Answer(models.Model):
         :return: True if the Answer has at least one response of Professor type not assessed, False otherwise
         :rtype: bool
         """
-        professor = False
-        for index, question in enumerate(self.test_exercice.exercice.get_questions()):
-            if question.get_type() == "professor" and self.get_correction(index) == -1:
-                professor = True
-        return professor
+        # Only the responses to professor-type Questions are not graded automatically (see grader)
+        return self.pending_professor_review > 0
 
     def assess(self, index, correction):
         """Grades manually an answer to a question
@@ -295,10 +493,15 @@ class Answer(models.Model):
         if answers[str(index)]["correct"] == correction:
             return False
         else:
+            before = {str(index): dict(answers[str(index)])}
             answers[str(index)]["correct"] = correction
-            new_answer = [answers]
-            self.raw_answer = json.dumps(new_answer, indent=4)
+            self.raw_answer = [answers]
             self.save()
+
+            context_id = self.test_exercice.exercice_id
+            question_ids = QuestionStats.question_ids([context_id]).get(context_id, [])
+            counts = count_responses(question_ids, before, sign=-1)
+            QuestionStats.apply(count_responses(question_ids, {str(index): answers[str(index)]}, counts))
             return True
 
     def get_correction(self, index):
@@ -322,16 +525,11 @@ class Answer(models.Model):
                 0 if there is at least one mistake
         :rtype: int
         """
-        for question in json.loads(self.raw_answer)[0].values():
-            if question["correct"] == -1:
-                return -1
-            elif question["correct"] != 1:
-                return 0
-        return 1
+        return evaluate_responses(self.get_answers())
 
     def get_answers(self):
         """Get the list of answers"""
-        return json.loads(self.raw_answer)[0]
+        return load_responses(self.raw_answer)
 
 
 class TestStudent(models.Model):
@@ -350,20 +548,68 @@ class TestStudent(models.Model):
     """The date the Student started the Test"""
     finished_at = models.DateTimeField(null=True)
     """The date the Student finished the Test"""
+    pending_professor_review = models.PositiveIntegerField(default=0)
+    """The number of responses of its Answers waiting for the assessment of a Professor"""
+    remaining_test_exercices = ArrayField(models.IntegerField(), null=True, blank=True)
+    """The ids of the TestExercices to answer online not answered yet, in order,
+        computed when started (None to compute again, see get_next_test_exercice)"""
 
     class Meta:
         ordering = ['test__created_at']
 
+    def compute_remaining_test_exercices(self):
+        """Get the ids of the TestExercices to answer online not answered yet, in the order they are taken"""
+        # the order_by here is used to make the order of the exercices deterministics
+        # so each student will have the exercices in the same order
+        return list(TestExercice.objects.filter(
+            test=self.test_id,
+            exercice__isnull=False,
+            testable_online=True,
+        ).exclude(answer__test_student=self).order_by("created_at", "id").values_list("id", flat=True))
+
+    def start(self):
+        """The Student starts the Test"""
+        self.started_at = datetime.now()
+        self.remaining_test_exercices = self.compute_remaining_test_exercices()
+        self.save()
+
+    def get_next_test_exercice(self):
+        """Get the next TestExercice to answer online, with its Context, None if all of them are answered
+
+        :rtype: TestExercice
+        """
+        if self.remaining_test_exercices is None:
+            self.remaining_test_exercices = self.compute_remaining_test_exercices()
+            TestStudent.objects.filter(pk=self.pk).update(remaining_test_exercices=self.remaining_test_exercices)
+
+        if not self.remaining_test_exercices:
+            return None
+
+        test_exercice = TestExercice.objects.select_related("test", "skill", "exercice").filter(
+            pk=self.remaining_test_exercices[0], exercice__isnull=False, testable_online=True).first()
+
+        if test_exercice is None:
+            # the TestExercice changed in the meantime
+            self.remaining_test_exercices = None
+            return self.get_next_test_exercice()
+
+        return test_exercice
+
+    def advance(self, test_exercice):
+        """Remove an answered TestExercice from the remaining ones"""
+        TestStudent.objects.filter(pk=self.pk).update(remaining_test_exercices=Func(
+            F("remaining_test_exercices"), Value(test_exercice.pk), function="array_remove"))
+
+        if self.remaining_test_exercices is not None:
+            self.remaining_test_exercices = [x for x in self.remaining_test_exercices if x != test_exercice.pk]
+
     def has_answers_to_assess(self):
         """Has the test at least one answer that need to be assessed by a Professor?
 
         :return: True if at least one answer is not corrected yet, False otherwise
         :rtype: bool
         """
-        for answer in self.answer_set.all():
-            if answer.contains_professor_not_assessed():
-                return True
-        return False
+        return self.pending_professor_review > 0
 
     def test_exercice_answer_for_offline_test(self):
         """Get the TestExercice with their answers for the offline tests"""
@@ -450,6 +696,8 @@ class Test(BaseTest):
     """True if the test is visible, False if invisible (not to confuse with "running")"""
     fully_testable_online = models.BooleanField(default=True)
     """True if all the Contexts in the Test can be graded automatically"""
+    pending_professor_review = models.PositiveIntegerField(default=0)
+    """The number of responses of the Students waiting for the assessment of a Professor"""
 
     type = models.CharField(max_length=255, choices=(
         ("skills", "skills"),
@@ -470,6 +718,10 @@ class Test(BaseTest):
             student=student
         )
 
+    def add_students(self, students):
+        """Subscribe several new Students in this Test, in a single statement"""
+        TestStudent.objects.bulk_create([TestStudent(test=self, student=student) for student in students])
+
     def testexercice_with_skills(self):
 
         return self.testexercice_set.select_related("skill").order_by('-skill__code')
@@ -477,6 +729,11 @@ class Test(BaseTest):
     def teststudent_with_student(self):
         return self.teststudent_set.select_related("student", "student__user")
 
+    def get_test_exercices_with_questions(self):
+        """Get the TestExercices with their Context and its questions, in two queries"""
+        return self.testexercice_set.select_related("exercice", "skill").prefetch_related(
+            prefetch_questions("exercice__list_question_set"))
+
     def testexercice_testable_online(self):
         return self.testexercice_set.filter(testable_online=True).select_related("skill")
 
@@ -492,67 +749,116 @@ class Test(BaseTest):
         if self.type == "skills-dependencies":
             return "compétences et prérequis"
 
+    def add_test_exercices(self, skill_ids):
+        """
+        Create the TestExercices of some Skills, in a single statement.
+
+        The Skills are added once each, in the given order. The bulk
+        creation sends no post_save, so the next TestExercices of the
+        Students are reset here (see reset_remaining_test_exercices).
+        """
+        seen = set()
+        skill_ids = [x for x in skill_ids if not (x in seen or seen.add(x))]
+
+        TestExercice.objects.bulk_create([TestExercice(test=self, skill_id=skill_id) for skill_id in skill_ids])
+
+        self.teststudent_set.filter(remaining_test_exercices__isnull=False).update(remaining_test_exercices=None)
+
     def generate_skills_test(self):
         """Generate the TestExercices with all the Skills attached to this Test"""
-        for skill in self.skills.all():
-            TestExercice.objects.create(
-                test=self,
-                skill=skill,
-            )
+        self.add_test_exercices(self.skills.values_list("id", flat=True))
 
     def generate_dependencies_test(self):
         """
         Add the prerequisites corresponding to the selected Skills to the Test.
         Useful when the Professor creates a Test about Skills prerequisites (but not Skills themselves)
         """
-        to_test_skills = []
-
-        def recursivly_get_skills_to_test(skill):
-            for i in skill.get_prerequisites_skills():
-                if i not in to_test_skills:
-                    to_test_skills.append(i)
-                    recursivly_get_skills_to_test(i)
-
-        for skill in self.skills.all():
-            recursivly_get_skills_to_test(skill)
-
-        for skill in to_test_skills:
-            TestExercice.objects.create(
-                test=self,
-                skill=skill,
-            )
+        self.add_test_exercices(get_skill_graph().walk_prerequisites(self.skills.values_list("id", flat=True)))
 
     def generate_skills_dependencies_test(self):
         """
         Add the selected Skills and their prerequisites to the Test.
         Useful when the Professor creates a Test about both Skills AND their prerequisites
         """
-        to_test_skills = []
+        graph = get_skill_graph()
+        skills = list(self.skills.values_list("id", flat=True))
 
-        def recursivly_get_skills_to_test(skill):
-            for i in skill.get_prerequisites_skills():
-                # we don't add dependencies that can't be tested online
-                if i not in to_test_skills and skill.context_set.filter(testable_online=True).exists():
-                    to_test_skills.append(i)
-                    recursivly_get_skills_to_test(i)
+        reachable_skills = set(skills)
+        for skill_id in skills:
+            reachable_skills.update(graph.all_prerequisites(skill_id))
 
-        for skill in self.skills.all():
-            recursivly_get_skills_to_test(skill)
+        testable_online_skills = set(Context.objects.filter(
+            skill__in=reachable_skills,
+            testable_online=True,
+        ).values_list("skill_id", flat=True))
 
-            TestExercice.objects.create(
-                test=self,
-                skill=skill,
-            )
+        # we don't add dependencies that can't be tested online
+        to_test_skills = graph.walk_prerequisites(skills, follow=lambda x: x in testable_online_skills)
 
-        for skill in to_test_skills:
-            if TestExercice.objects.filter(skill=skill, test=self).exists():
-                continue
+        # the selected Skills first, then their prerequisites not selected
+        self.add_test_exercices(skills + to_test_skills)
 
-            TestExercice.objects.create(
-                test=self,
-                skill=skill,
+    def assign_exercices(self, seed=None):
+        """
+        Pick at random an exercise (Context) for each TestExercice without one.
+
+        The approved online Contexts of the Skill and of the Skills identical
+        to it (see skills.equivalence) are candidates. Without any, the
+        TestExercice is offline, with an offline Context of the Skill if
+        there is one. The candidates are loaded at once and all the
+        TestExercices are updated in a single statement.
+
+        :param seed: The seed of the random choices, the Test id by default
+        """
+        rng = random.Random(self.pk if seed is None else seed)
+
+        test_exercices = list(self.testexercice_set.filter(exercice__isnull=True).order_by("id").values_list(
+            "id", "skill_id"))
+        skill_ids = {skill_id for _, skill_id in test_exercices}
+
+        if not test_exercices:
+            return
+
+        equivalence = get_skill_equivalence()
+        identic_skills = {skill_id: equivalence.identic_skills(skill_id) for skill_id in skill_ids}
+
+        # the approved Contexts by Skill and by testable_online
+        contexts = {}
+        for context_id, skill_id, testable_online in Context.objects.filter(
+                approved=True, skill__in=frozenset.union(*identic_skills.values())).order_by("id").values_list(
+                "id", "skill_id", "testable_online"):
+            contexts.setdefault((skill_id, testable_online), []).append(context_id)
+
+        exercices, offline = {}, []
+        for test_exercice_id, skill_id in test_exercices:
+            candidates = sorted(
+                context_id for identic_skill in identic_skills[skill_id]
+                for context_id in contexts.get((identic_skill, True), []))
+
+            if not candidates:
+                # switch to offline exercices
+                offline.append(test_exercice_id)
+                candidates = contexts.get((skill_id, False), [])
+
+            if candidates:
+                exercices[test_exercice_id] = rng.choice(candidates)
+
+        with transaction.atomic():
+            TestExercice.objects.filter(pk__in=[x for x, _ in test_exercices]).update(
+                exercice=Case(
+                    *[When(pk=pk, then=Value(context_id)) for pk, context_id in exercices.items()],
+                    default=F("exercice"), output_field=models.IntegerField()
+                ),
+                testable_online=Case(
+                    *[When(pk=pk, then=Value(False)) for pk in offline],
+                    default=F("testable_online"), output_field=models.BooleanField()
+                ),
             )
 
+            if offline and self.fully_testable_online:
+                self.fully_testable_online = False
+                self.save(update_fields=["fully_testable_online"])
+
     def __unicode__(self):
         return self.name
 
@@ -600,3 +906,60 @@ class TestSkillFromClass(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     """The offline test date of creation"""
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_parsed_answer(sender, instance, **kwargs):
+    parsed_answers.invalidate(instance.pk)
+
+
+def touch_contexts(contexts):
+    """Mark some Contexts as modified, their cached rendering is not used anymore (see examinations.rendering)"""
+    Context.objects.filter(pk__in=contexts).update(modified_at=timezone.now())
+
+
+@receiver(post_save, sender=Question)
+def touch_question_contexts(sender, instance, **kwargs):
+    touch_contexts(List_question.objects.filter(question=instance.pk).values("context"))
+
+
+@receiver(post_save, sender=List_question)
+@receiver(post_delete, sender=List_question)
+def touch_list_question_context(sender, instance, **kwargs):
+    touch_contexts([instance.context_id])
+
+
+@receiver(post_save, sender=Answer)
+def count_new_answer(sender, instance, created, **kwargs):
+    if created:
+        QuestionStats.apply_answer(instance)
+
+
+@receiver(post_delete, sender=Answer)
+def uncount_deleted_answer(sender, instance, **kwargs):
+    QuestionStats.apply_answer(instance, sign=-1)
+
+
+@receiver(post_save, sender=Answer)
+def roll_up_saved_answer(sender, instance, created, **kwargs):
+    before = 0 if created else getattr(instance, "_loaded_pending", instance.pending_professor_review)
+    instance._loaded_pending = instance.pending_professor_review
+
+    Answer.roll_up_pending({instance.test_student_id: instance.pending_professor_review - before})
+
+
+@receiver(post_delete, sender=Answer)
+def roll_up_deleted_answer(sender, instance, **kwargs):
+    before = getattr(instance, "_loaded_pending", instance.pending_professor_review)
+
+    Answer.roll_up_pending({instance.test_student_id: -before})
+
+
+@receiver(post_save, sender=TestExercice)
+@receiver(post_delete, sender=TestExercice)
+def reset_remaining_test_exercices(sender, instance, **kwargs):
+    # the TestExercices to answer changed, computed again at the next step of the Students
+    TestStudent.objects.filter(test=instance.test_id, remaining_test_exercices__isnull=False).update(
+        remaining_test_exercices=None)
+
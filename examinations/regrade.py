@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Grade again the Answers to a Context after its Questions have been modified"""
+from __future__ import unicode_literals
+
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from skills.models import SkillHistory
+from skills.propagation import SkillPropagation
+
+from .grading import grader, evaluate_responses, count_responses, count_pending, load_responses
+from .models import Answer, Context, QuestionStats, TestExercice
+
+REGRADE_CHUNK_SIZE = 500
+"""The number of Answers graded and written together"""
+
+REGRADE_REASON = "Correction de l'exercice modifiée."
+"""The reason stored in the SkillHistory of the Skills validated again"""
+
+
+class RegradeResult(object):
+    """What changed (or would change, in dry-run mode) when grading again"""
+
+    def __init__(self, total):
+        self.total = total
+        self.graded = 0
+        self.changed_verdicts = 0
+        self.changed_answers = 0
+        self.changed_skills = 0
+
+
+def _grade_again(responses, graders, question_ids, counts):
+    """Grade again in place the responses of an Answer, and count the changes of the counters of the Questions
+
+    The questions not graded automatically keep the correction of the Professor.
+
+    :returns: The number of changed verdicts
+    """
+    changed = 0
+    for index, grade_response in enumerate(graders):
+        response = responses.get(str(index))
+        if response is None:
+            continue
+
+        correct = grade_response(response["response"])
+        # Not automatically graded: keep the correction of the Professor
+        if correct == -1 or correct == response["correct"]:
+            continue
+
+        count_responses(question_ids, {str(index): response}, counts, sign=-1)
+        response["correct"] = correct
+        count_responses(question_ids, {str(index): response}, counts)
+        changed += 1
+
+    return changed
+
+
+def changed_since(context, last_answers):
+    """Find the StudentSkills changed for another reason than the last Answer of their Student to a Context
+
+    A later Answer to another Context, the validation by a Professor or the
+    propagation from another Skill are newer than this Answer: its verdict
+    is not replayed over them. The SkillHistories of the Answer itself and
+    of the previous regrades of the Context are not newer.
+
+    :param last_answers: The (answer_datetime, test_exercice_id) of the last Answer, by (student_id, skill_id)
+    :returns: The (student_id, skill_id) changed since
+    :rtype: set
+    """
+    if not last_answers:
+        return set()
+
+    test_exercice_type = ContentType.objects.get_for_model(TestExercice).id
+    histories = SkillHistory.objects.filter(
+        student__in={student_id for student_id, _ in last_answers},
+        skill__in={skill_id for _, skill_id in last_answers},
+        datetime__gt=min(answer_datetime for answer_datetime, _ in last_answers.values()),
+    ).exclude(content_type=ContentType.objects.get_for_model(Context), object_id=context.id).values_list(
+        "student_id", "skill_id", "datetime", "content_type_id", "object_id")
+
+    changed = set()
+    for student_id, skill_id, datetime, content_type_id, object_id in histories:
+        if (student_id, skill_id) not in last_answers:
+            continue
+
+        answer_datetime, test_exercice_id = last_answers[(student_id, skill_id)]
+        if datetime > answer_datetime and (content_type_id, object_id) != (test_exercice_type, test_exercice_id):
+            changed.add((student_id, skill_id))
+
+    return changed
+
+
+def regrade_context(context, who, dry_run=False, chunk_size=REGRADE_CHUNK_SIZE, progress=None):
+    """
+    Grade again all the Answers to the Questions of a Context.
+
+    The Answers are read in chunks through a server-side cursor. The ones
+    whose grade changes are locked and graded again from their locked
+    raw_answer before being written back, not to lose a correction made
+    by a Professor meanwhile. Then the StudentSkill of every Student whose
+    last Answer to a Skill changed of verdict is validated or unvalidated
+    again, all at once, unless it changed since for another reason (see
+    changed_since).
+
+    Only the responses to questions still present in the Context are graded
+    again, and the questions corrected by a Professor keep their correction.
+
+    :param who: The User responsible for the changes of the StudentSkills
+    :param dry_run: Only count the changes, write nothing
+    :param progress: A function called with (graded, total) after each chunk
+    :rtype: RegradeResult
+    """
+    questions = context.get_questions()
+    graders = [grader(question.get_compiled_answer()) for question in questions]
+    question_ids = [question.id for question in questions]
+
+    answers = Answer.objects.filter(test_exercice__exercice=context, raw_answer__isnull=False)
+    result = RegradeResult(answers.count())
+
+    rows = answers.order_by("answer_datetime", "id").values_list(
+        "id", "raw_answer", "test_student__student_id", "test_exercice__skill_id", "answer_datetime",
+        "test_exercice_id").iterator()
+
+    # The verdict of the last Answer of a Student to a Skill if it changed, with its answer_datetime and test_exercice
+    last_verdicts = {}
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        # the verdicts (before, after) of the Answers whose grade changes
+        verdicts = {}
+        changed_verdicts = 0
+        for answer_id, raw_answer, _, _, _, _ in chunk:
+            responses = load_responses(raw_answer)
+            before = evaluate_responses(responses)
+
+            changed = _grade_again(responses, graders, question_ids, {})
+            if changed:
+                verdicts[answer_id] = (before, evaluate_responses(responses))
+                changed_verdicts += changed
+
+        if not dry_run and verdicts:
+            # graded again once locked, a Professor may have corrected them since read
+            to_lock, verdicts, changed_verdicts = sorted(verdicts), {}, 0
+            # the changes of the counters of the Questions (see QuestionStats)
+            counts = {}
+            # the changes of the number of responses to assess, by TestStudent (see Answer.roll_up_pending)
+            pending_deltas = {}
+
+            with transaction.atomic():
+                locked = Answer.objects.select_for_update().filter(pk__in=to_lock).order_by("pk").values_list(
+                    "id", "raw_answer", "test_student_id")
+
+                for answer_id, raw_answer, test_student_id in locked:
+                    responses = load_responses(raw_answer)
+                    before = evaluate_responses(responses)
+                    pending_before = count_pending(responses)
+
+                    changed = _grade_again(responses, graders, question_ids, counts)
+                    if not changed:
+                        continue
+
+                    pending = count_pending(responses)
+                    Answer.objects.filter(pk=answer_id).update(raw_answer=[responses], pending_professor_review=pending)
+
+                    pending_deltas[test_student_id] = pending_deltas.get(test_student_id, 0) + pending - pending_before
+                    verdicts[answer_id] = (before, evaluate_responses(responses))
+                    changed_verdicts += changed
+
+                QuestionStats.apply(counts)
+                Answer.roll_up_pending(pending_deltas)
+
+        for answer_id, _, student_id, skill_id, answer_datetime, test_exercice_id in chunk:
+            if skill_id is not None:
+                before, after = verdicts.get(answer_id, (None, None))
+                last_verdicts[(student_id, skill_id)] = (after if after != before else None, answer_datetime,
+                                                         test_exercice_id)
+
+        result.graded += len(chunk)
+        result.changed_verdicts += changed_verdicts
+        result.changed_answers += len(verdicts)
+
+        if progress is not None:
+            progress(result.graded, result.total)
+
+    last_answers = {key: x[1:] for key, x in last_verdicts.items() if x[0] in (0, 1)}
+    changed = changed_since(context, last_answers)
+    last_verdicts = {key: last_verdicts[key][0] for key in last_answers if key not in changed}
+    result.changed_skills = len(last_verdicts)
+
+    if not dry_run and last_verdicts:
+        propagation = SkillPropagation(who)
+        propagation.prefetch([student_id for student_id, _ in last_verdicts])
+
+        for (student_id, skill_id), verdict in last_verdicts.items():
+            if verdict == 1:
+                propagation.validate(student_id, skill_id, REGRADE_REASON, context)
+            else:
+                propagation.unvalidate(student_id, skill_id, REGRADE_REASON, context)
+
+        with transaction.atomic():
+            propagation.save()
+
+    return result
+
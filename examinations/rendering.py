@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Cache of the rendering of the Questions of a Context, the same for all the Students"""
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import List_question
+
+EXERCICE_RENDERING_TIMEOUT = 24 * 60 * 60
+"""The time a rendering is kept in the cache, in seconds"""
+
+
+def exercice_rendering_key(context, question_ids):
+    """The cache key of the rendering of a Context, changing with the Context and its Questions
+
+    A Context is modified (its modified_at updated) when one of its Questions is, see touch_contexts
+    """
+    version = "%s:%s" % (context.modified_at.isoformat(), ",".join(str(x) for x in question_ids))
+    return "exercice_rendering:%s:%s" % (context.pk, hashlib.sha1(version.encode("Utf-8")).hexdigest())
+
+
+def render_exercice(context):
+    """Render the Questions of a Context, or get their rendering from the cache
+
+    :returns: The HTML of the Questions ("questions") and the JavaScript of their graphs ("graphs")
+    :rtype: dict
+    """
+    question_ids = List_question.objects.filter(context=context).values_list("question_id", flat=True)
+    key = exercice_rendering_key(context, question_ids)
+
+    rendered = cache.get(key)
+    if rendered is None:
+        questions = context.get_questions()
+        rendered = {
+            "questions": render_to_string("examinations/exercice_questions.haml", {"questions": questions}),
+            "graphs": render_to_string("examinations/exercice_graphs.html", {"questions": questions}),
+        }
+        cache.set(key, rendered, EXERCICE_RENDERING_TIMEOUT)
+
+    return {name: mark_safe(html) for name, html in rendered.items()}
@@ -1,3 +1,7 @@
+from collections import OrderedDict
+
+from answer_cache import ParsedAnswerCache
+from grading import compile_answer, grade, grade_batch, count_pending, count_responses, load_responses
 from generation import needs_to_be_generated, get_variable_list, render
 
 
@@ -55,3 +59,115 @@ def test_render_always_lower_case():
     a, a2 = render("{a} {A}", {"a": 1}).split(" ")
 
     assert a == a2
+
+
+class FakeQuestion():
+    def __init__(self, pk, answer):
+        self.pk = pk
+        self.answer = answer
+
+
+def test_parsed_answer_cache_hit():
+    cache = ParsedAnswerCache()
+    question = FakeQuestion(1, "type: text\nanswers:\n- a\n")
+
+    assert cache.get(question) is cache.get(question)
+    assert cache.get(question)["answers"] == ["a"]
+
+
+def test_parsed_answer_cache_new_version():
+    cache = ParsedAnswerCache()
+    question = FakeQuestion(1, "type: text\nanswers:\n- a\n")
+    cache.get(question)
+
+    question.answer = "type: text\nanswers:\n- b\n"
+    assert cache.get(question)["answers"] == ["b"]
+
+
+def test_parsed_answer_cache_eviction():
+    cache = ParsedAnswerCache(max_size=2)
+    questions = [FakeQuestion(i, "type: text\nanswers:\n- a\n") for i in range(3)]
+    first = cache.get(questions[0])
+    cache.get(questions[1])
+    cache.get(questions[0])
+    cache.get(questions[2])
+
+    # the least recently used one (1) is dropped, not 0
+    assert cache.get(questions[0]) is first
+    assert len(cache._entries) == 2
+
+
+def test_grade_math_equivalences():
+    compiled = compile_answer({"type": "math-simple", "answers": ["0,585"]})
+    assert grade(compiled, ["0.585"]) == 1
+    assert grade(compiled, ["0,585000"]) == 1
+    assert grade(compiled, ["0,58"]) == 0
+
+
+def test_grade_radio_out_of_range():
+    compiled = compile_answer({"type": "radio", "answers": OrderedDict([("a", False), ("b", True)])})
+    assert grade(compiled, [1]) == 1
+    assert grade(compiled, [0]) == 0
+    assert grade(compiled, [2]) == 0
+    assert grade(compiled, [-1]) == 0
+
+
+def test_grade_checkbox():
+    compiled = compile_answer({"type": "checkbox", "answers": OrderedDict([("a", True), ("b", False), ("c", True)])})
+    assert grade(compiled, [0, 2]) == 1
+    assert grade(compiled, [0]) == 0
+    assert grade(compiled, [0, 1, 2]) == 0
+
+
+def test_grade_graph():
+    compiled = compile_answer({"type": "graph", "answers": [
+        {"graph": {"type": "point", "coordinates": {"X": 1, "Y": 2}}},
+        {"graph": {"type": "point", "coordinates": {"X": 3, "Y": 4}}},
+    ]})
+    assert grade(compiled, [{"coordinates": {"X": "3", "Y": "4"}}, {"coordinates": {"X": "1", "Y": "2"}}]) == 1
+    assert grade(compiled, [{"coordinates": {"X": "1", "Y": "2"}}, {"coordinates": {"X": "1", "Y": "2"}}]) == 0
+    assert grade(compiled, [{"coordinates": {"X": "a", "Y": "2"}}]) == 0
+
+
+def test_grade_batch():
+    question = FakeQuestion(1, "")
+    question.get_compiled_answer = lambda: compile_answer({"type": "text", "answers": ["Paris", "paris "]})
+    assert grade_batch(question, [["Paris"], [" PA RIS"], ["Lyon"], []]) == [1, 1, 0, 0]
+
+
+def test_count_responses():
+    responses = {
+        "0": {"response": ["a"], "correct": 1},
+        "1": {"response": ["b"], "correct": 0},
+        "2": {"response": ["c"], "correct": -1},
+    }
+
+    counts = count_responses([10, 11, 12], responses)
+    assert counts == {
+        10: {"attempts": 1, "correct": 1},
+        11: {"attempts": 1, "incorrect": 1},
+        12: {"attempts": 1, "pending": 1},
+    }
+
+    # a Professor assesses the third response
+    count_responses([10, 11, 12], {"2": {"response": ["c"], "correct": -1}}, counts, sign=-1)
+    count_responses([10, 11, 12], {"2": {"response": ["c"], "correct": 1}}, counts)
+    assert counts[12] == {"attempts": 1, "pending": 0, "correct": 1}
+
+
+def test_load_responses():
+    responses = {"0": {"response": ["a"], "correct": 1}}
+
+    assert load_responses([responses]) == responses
+    # saved before raw_answer was stored as JSON
+    assert load_responses('[{"0": {"response": ["a"], "correct": 1}}]') == responses
+
+
+def test_count_pending():
+    assert count_pending({}) == 0
+    assert count_pending({
+        "0": {"response": ["a"], "correct": 1},
+        "1": {"response": ["b"], "correct": -1},
+        "2": {"response": ["c"], "correct": -1},
+    }) == 2
+
@@ -219,4 +219,7 @@ EMAIL_USE_TLS = True
 CRONJOBS = [
     ('* * * * *', 'django.core.management.call_command', ['close_pending_help_requests']),
     ('* * * * *', 'django.core.management.call_command', ['set_help_requests_to_pending']),
+    ('* * * * *', 'django.core.management.call_command', ['regrade_pending_contexts']),
 ]
+# A job still running is not started again, a regrade can take several minutes
+CRONTAB_LOCK_JOBS = True
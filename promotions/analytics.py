@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Analytics of a Lesson: the SkillHistory, StudentSkill and Answer data loaded once in DataFrames"""
+from __future__ import unicode_literals
+
+from io import BytesIO
+
+import pandas as pd
+
+from examinations.grading import load_responses
+from examinations.models import Answer, List_question
+from skills.matrix import StudentSkillMatrix, ACQUIRED, NOT_ACQUIRED, UNKNOWN
+from skills.models import Skill, SkillHistory
+
+from .models import Stage
+
+ANALYTICS_TABLES = ("students", "skills", "questions", "acquisitions")
+"""The tables of the analytics, in the order of the export"""
+
+
+class LessonAnalytics(object):
+    """
+        Loads the data of a Lesson with a few queries (one per kind of data)
+        and computes its analytics with pandas.
+
+    """
+
+    def __init__(self, lesson):
+        self.lesson = lesson
+
+        self.students = pd.DataFrame.from_records(
+            [(x.id, unicode(x)) for x in lesson.students.select_related("user")],
+            columns=["student_id", "student"],
+        )
+
+        skill_ids = Stage.skills.through.objects.filter(
+            stage__in=lesson.stages_in_unchronological_order()).values_list("skill_id", flat=True).distinct()
+        self.skills = pd.DataFrame.from_records(
+            list(Skill.objects.filter(id__in=skill_ids).order_by("code").values_list("id", "code", "name")),
+            columns=["skill_id", "code", "name"],
+        )
+
+        self.matrix = StudentSkillMatrix.load(self.students["student_id"].tolist(), self.skills["skill_id"].tolist())
+
+        self.history = pd.DataFrame.from_records(
+            list(SkillHistory.objects.filter(
+                student__in=self.matrix.student_ids, skill__in=self.matrix.skill_ids).values_list(
+                "student_id", "skill_id", "value", "datetime")),
+            columns=["student_id", "skill_id", "value", "datetime"],
+        )
+
+        self.answers = self._load_answers()
+
+    def _load_answers(self):
+        """One row by response to a Question: student_id, context_id, question_id, correct"""
+        answers = Answer.objects.filter(
+            test_student__test__lesson=self.lesson,
+            test_exercice__exercice__isnull=False,
+            raw_answer__isnull=False,
+        ).values_list("test_student__student_id", "test_exercice__exercice_id", "raw_answer")
+
+        rows = []
+        context_questions = {}
+        for student_id, context_id, raw_answer in answers.iterator():
+            context_questions[context_id] = None
+            for index, response in load_responses(raw_answer).items():
+                rows.append((student_id, context_id, int(index), response.get("correct")))
+
+        responses = pd.DataFrame.from_records(rows, columns=["student_id", "context_id", "index", "correct"])
+
+        # the responses are numbered in the order of the Questions of the Context, see Context.get_questions
+        links = pd.DataFrame.from_records(
+            list(List_question.objects.filter(context__in=list(context_questions)).values_list(
+                "context_id", "question_id", "question__description")),
+            columns=["context_id", "question_id", "description"],
+        )
+        links["index"] = links.groupby("context_id").cumcount()
+
+        return responses.merge(links, on=["context_id", "index"], how="left")
+
+    def acquisitions(self):
+        """The number of acquired (Student, Skill) pairs at the end of each day"""
+        if self.history.empty:
+            return pd.DataFrame(columns=["date", "acquired"])
+
+        history = self.history.sort_values("datetime")
+        acquired = (history["value"] == "acquired").astype(int)
+        previous = acquired.groupby([history["student_id"], history["skill_id"]]).shift(1).fillna(0)
+
+        changes = (acquired - previous).groupby(history["datetime"].dt.date).sum()
+        curve = changes.cumsum().astype(int)
+
+        return pd.DataFrame({"date": curve.index, "acquired": curve.values}, columns=["date", "acquired"])
+
+    def skill_difficulty(self):
+        """By Skill: the number of Students by status, the acquisition rate and the difficulty (1 - rate)"""
+        skills = self.skills.copy()
+        skills["acquired"] = self.matrix.count(ACQUIRED)
+        skills["not_acquired"] = self.matrix.count(NOT_ACQUIRED)
+        skills["untested"] = self.matrix.count(UNKNOWN)
+        skills["acquisition_rate"] = self.matrix.acquisition_rate()
+        skills["difficulty"] = 1 - skills["acquisition_rate"]
+
+        return skills.drop("skill_id", axis=1).sort_values(["difficulty", "code"], ascending=[False, True])
+
+    def question_success(self):
+        """By Question: the number of attempts, correct, incorrect and not assessed responses and the success rate"""
+        columns = ["question_id", "description", "attempts", "correct", "incorrect", "pending", "success_rate"]
+
+        answers = self.answers.dropna(subset=["question_id"])
+        if answers.empty:
+            return pd.DataFrame(columns=columns)
+
+        questions = answers.assign(
+            attempts=1,
+            is_correct=(answers["correct"] == 1).astype(int),
+            is_incorrect=(answers["correct"] == 0).astype(int),
+            is_pending=(answers["correct"] == -1).astype(int),
+        ).groupby(["question_id", "description"], as_index=False)[
+            ["attempts", "is_correct", "is_incorrect", "is_pending"]].sum()
+
+        questions.columns = columns[:-1]
+        questions["question_id"] = questions["question_id"].astype(int)
+        questions["success_rate"] = questions["correct"] / (questions["correct"] + questions["incorrect"])
+
+        return questions.sort_values("success_rate")
+
+    def student_progress(self):
+        """By Student: the number of Skills by status, the coverage and the last Skill change"""
+        students = self.students.copy()
+        students["acquired"] = self.matrix.count(ACQUIRED, axis=1)
+        students["not_acquired"] = self.matrix.count(NOT_ACQUIRED, axis=1)
+        students["coverage"] = self.matrix.coverage()
+
+        if not self.history.empty:
+            last_change = self.history.groupby("student_id")["datetime"].max().rename("last_change")
+            students = students.join(last_change, on="student_id")
+        else:
+            students["last_change"] = None
+
+        return students.drop("student_id", axis=1).sort_values("student")
+
+    def tables(self):
+        """All the analytics tables, by name (see ANALYTICS_TABLES)"""
+        return {
+            "students": self.student_progress(),
+            "skills": self.skill_difficulty(),
+            "questions": self.question_success(),
+            "acquisitions": self.acquisitions(),
+        }
+
+    def to_csv(self, table):
+        """Export a table in CSV"""
+        return self.tables()[table].to_csv(index=False, encoding="Utf-8")
+
+    def to_xlsx(self):
+        """Export all the tables in an Excel file, a sheet by table"""
+        tables = self.tables()
+        output = BytesIO()
+
+        writer = pd.ExcelWriter(output, engine="openpyxl")
+        for name in ANALYTICS_TABLES:
+            tables[name].to_excel(writer, sheet_name=name, index=False)
+        writer.save()
+
+        return output.getvalue()
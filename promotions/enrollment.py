@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Enrollment of new Students in a Lesson, in bulk"""
+from __future__ import unicode_literals
+
+import re
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.template.defaultfilters import slugify
+
+from examinations.models import Test, TestStudent
+from users.models import Student
+
+from .models import Lesson
+from .signals import student_added_to_lesson
+
+BULK_BATCH_SIZE = 1000
+"""The number of rows inserted by statement"""
+
+
+class EnrollmentError(ValueError):
+    """A batch of new Students that can not be created, with the message to display to the Professor"""
+
+
+def generate_usernames(names):
+    """Generate unique usernames "first_name.last_name" for several new Users at once
+
+    The duplicated usernames get a number, as StudentAddForm.generate_student_username
+
+    :param names: The (first_name, last_name) of the Users
+    :returns: The usernames, in the same order
+    :rtype: list
+    """
+    bases = [slugify(first_name) + "." + slugify(last_name) for first_name, last_name in names]
+
+    taken = set()
+    if bases:
+        query = Q()
+        for base in set(bases):
+            query |= Q(username__regex=r"^%s[0-9]*$" % re.escape(base))
+        taken = set(User.objects.filter(query).values_list("username", flat=True))
+
+    # the new usernames are taken too, for the homonyms of a batch to get different ones
+    usernames = []
+    for base in bases:
+        username, number = base, 1
+        while username in taken:
+            username = base + str(number)
+            number += 1
+
+        taken.add(username)
+        usernames.append(username)
+
+    return usernames
+
+
+def check_emails(emails):
+    """Check that the emails of several new Users are unique, in the batch and in the database
+
+    The emails are unique like in StudentAddForm.clean_email: a User is
+    found by its email to send it a new password.
+
+    :raises EnrollmentError: If an email is given twice or is already used
+    """
+    seen, duplicated = set(), set()
+    for email in emails:
+        if email in seen:
+            duplicated.add(email)
+        seen.add(email)
+
+    if duplicated:
+        raise EnrollmentError("Erreur : ces adresses email sont données plusieurs fois : %s. "
+                              "Aucun élève n'a été importé." % ", ".join(sorted(duplicated)))
+
+    used = set(User.objects.filter(email__in=emails).values_list("email", flat=True))
+    if used:
+        raise EnrollmentError("Erreur : ces adresses email sont déjà utilisées par un autre utilisateur : %s. "
+                              "Aucun élève n'a été importé." % ", ".join(sorted(used)))
+
+
+def enroll_students(lesson, names):
+    """
+    Create new Students in a Lesson, with a few statements whatever their number.
+
+    The Users are created without password (set_unusable_password): the
+    Students create it themselves with their code, so there is nothing to hash.
+    Each Student is subscribed to the running Tests of the Lesson. Its
+    StudentSkills are created when tested (see SkillPropagation).
+
+    Nothing is created if a username or an email would be used twice.
+
+    :param names: The (first_name, last_name, email) of the Students, email may be None
+    :returns: The Students created
+    :rtype: list
+    :raises EnrollmentError: If the batch can not be created
+    """
+    if not names:
+        return []
+
+    usernames = generate_usernames([(first_name, last_name) for first_name, last_name, _ in names])
+    # hack, django enforce an email usage, let's use @example.com for "I don't have an email"
+    emails = [email or username + "@example.com" for (_, _, email), username in zip(names, usernames)]
+    check_emails(emails)
+
+    # resolved once for all the Students
+    tests = list(Test.objects.filter(lesson=lesson, running=True))
+
+    with transaction.atomic():
+        users = []
+        for (first_name, last_name, _), username, email in zip(names, usernames, emails):
+            user = User(
+                username=username,
+                email=email,
+                first_name=first_name,
+                last_name=last_name,
+            )
+            user.set_unusable_password()
+            users.append(user)
+
+        try:
+            users = User.objects.bulk_create(users, batch_size=BULK_BATCH_SIZE)
+        except IntegrityError:
+            # a username generated has been taken by another request meanwhile
+            raise EnrollmentError("Erreur : d'autres élèves ont été ajoutés en même temps, aucun élève n'a été "
+                                  "importé. Veuillez réessayer.")
+
+        students = Student.objects.bulk_create([Student(user=user) for user in users], batch_size=BULK_BATCH_SIZE)
+
+        TestStudent.objects.bulk_create(
+            [TestStudent(test=test, student=student) for test in tests for student in students],
+            batch_size=BULK_BATCH_SIZE,
+        )
+
+        lesson.students.add(*students)
+
+        # send signal to tell a student was added to a lesson ; default signal not working
+        for student in students:
+            student_added_to_lesson.send(sender=Lesson, student=student, level=lesson.stage.level)
+
+    return students
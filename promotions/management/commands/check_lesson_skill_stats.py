@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from promotions.models import LessonSkillStats
+
+
+class Command(BaseCommand):
+
+    help = "Compare the per Lesson Skill counters (LessonSkillStats) with the StudentSkills"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lesson", dest="lessons", action="append", type=int,
+                            help="The Lesson to check, all the Lessons by default")
+        parser.add_argument("--fix", action="store_true", dest="fix", default=False,
+                            help="Compute again the counters of the inconsistent Lessons")
+
+    def handle(self, *args, **options):
+        differences = LessonSkillStats.check_consistency(options["lessons"])
+
+        for lesson_id, skill_id, stored, live in differences:
+            self.stdout.write("Lesson %s, Skill %s: stored %s, live %s (acquired, not acquired, untested)" % (
+                lesson_id, skill_id, stored, live))
+
+        if not differences:
+            self.stdout.write("The counters are consistent")
+        elif options["fix"]:
+            LessonSkillStats.rebuild(sorted({x[0] for x in differences}))
+            self.stdout.write("%s counters fixed" % len(differences))
+        else:
+            raise CommandError("%s counters are inconsistent" % len(differences))
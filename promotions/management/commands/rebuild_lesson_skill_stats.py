@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from promotions.models import LessonSkillStats
+
+
+class Command(BaseCommand):
+
+    help = "Compute again from scratch the per Lesson Skill counters (LessonSkillStats)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lesson", dest="lessons", action="append", type=int,
+                            help="The Lesson to compute again, all the Lessons by default")
+
+    def handle(self, *args, **options):
+        LessonSkillStats.rebuild(options["lessons"])
+
+        self.stdout.write("%s counters computed" % LessonSkillStats.objects.count())
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.db import models
-from django.db.models import Count
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, Sum, Case, When, F
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from skills.signals import student_skills_changed
 
 # Create your models here.
 
@@ -64,4 +68,287 @@ class Lesson(models.Model):
             stage = stage.previous_stage
             stages.append(stage)
 
-        return stages
\ No newline at end of file
+        return stages
+
+STATUS_COUNTERS = {
+    "acquired": "acquired",
+    "not acquired": "not_acquired",
+    "unknown": "untested",
+}
+"""The counter of LessonSkillStats for each status of a StudentSkill"""
+
+
+class LessonSkillStats(models.Model):
+    """
+        The number of Students of a Lesson having acquired, not acquired
+        or not tested yet a Skill.
+
+        Materialized from the StudentSkills to render the heatmap and the
+        Skill pages of a Lesson without counting the StudentSkills of all its
+        Students. The counters are updated with the status transitions of the
+        StudentSkills (see skills.signals.student_skills_changed).
+
+    """
+
+    lesson = models.ForeignKey(Lesson)
+    """The Lesson"""
+    skill = models.ForeignKey("skills.Skill")
+    """The Skill"""
+    acquired = models.PositiveIntegerField(default=0)
+    """The number of Students having acquired the Skill"""
+    not_acquired = models.PositiveIntegerField(default=0)
+    """The number of Students having been tested without acquiring the Skill"""
+    untested = models.PositiveIntegerField(default=0)
+    """The number of Students not tested yet on the Skill"""
+
+    class Meta:
+        unique_together = ('lesson', 'skill')
+
+    def __unicode__(self):
+        return u"%s - %s" % (self.lesson, self.skill)
+
+    def get_heatmap_class(self):
+        """The heatmap class, according to the part of the tested Students having acquired the Skill"""
+        total = self.acquired + self.not_acquired
+
+        if total == 0:
+            return ""
+
+        percentage = float(self.acquired) / total
+
+        if percentage < 0.25:
+            return "mastered_25"
+        elif percentage < 0.5:
+            return "mastered_50"
+        elif percentage < 0.75:
+            return "mastered_75"
+        else:
+            return "mastered_100"
+
+    @staticmethod
+    def number_of_students(lesson_ids):
+        """Count the Students of some Lessons, by Lesson id"""
+        return dict(Lesson.students.through.objects.filter(lesson__in=lesson_ids).values(
+            "lesson").annotate(number=Count("student")).values_list("lesson", "number"))
+
+    @staticmethod
+    def aggregate(lesson_ids, skill_ids=None):
+        """Count the StudentSkills in the database, grouped by Lesson and Skill
+
+        A Student without StudentSkill for a Skill has not tested it yet.
+
+        :returns: The counts (acquired, not_acquired, untested) by (lesson_id, skill_id)
+        :rtype: dict
+        """
+        from skills.models import StudentSkill
+
+        student_skills = StudentSkill.objects.filter(student__lesson__in=lesson_ids)
+        if skill_ids is not None:
+            student_skills = student_skills.filter(skill__in=skill_ids)
+
+        counts = student_skills.values("student__lesson", "skill").annotate(
+            number_acquired=Sum(Case(
+                When(acquired__isnull=False, then=1),
+                default=0, output_field=models.IntegerField(),
+            )),
+            number_not_acquired=Sum(Case(
+                When(acquired__isnull=True, tested__isnull=False, then=1),
+                default=0, output_field=models.IntegerField(),
+            )),
+        )
+
+        number_of_students = LessonSkillStats.number_of_students(lesson_ids)
+
+        return {
+            (x["student__lesson"], x["skill"]): (
+                x["number_acquired"],
+                x["number_not_acquired"],
+                number_of_students[x["student__lesson"]] - x["number_acquired"] - x["number_not_acquired"],
+            )
+            for x in counts
+        }
+
+    @classmethod
+    def refresh(cls, lesson_ids, skill_ids=None):
+        """Compute again the stats of some Lessons, for some Skills or all of them"""
+        counts = cls.aggregate(lesson_ids, skill_ids)
+
+        existing = cls.objects.filter(lesson__in=lesson_ids)
+        if skill_ids is not None:
+            existing = existing.filter(skill__in=skill_ids)
+
+        with transaction.atomic():
+            to_delete = []
+            for stats in existing:
+                key = (stats.lesson_id, stats.skill_id)
+
+                if key not in counts:
+                    to_delete.append(stats.id)
+                    continue
+
+                values = counts.pop(key)
+                if values != (stats.acquired, stats.not_acquired, stats.untested):
+                    stats.acquired, stats.not_acquired, stats.untested = values
+                    stats.save(update_fields=["acquired", "not_acquired", "untested"])
+
+            if to_delete:
+                cls.objects.filter(id__in=to_delete).delete()
+
+            cls.objects.bulk_create([
+                cls(lesson_id=lesson_id, skill_id=skill_id, acquired=acquired, not_acquired=not_acquired,
+                    untested=untested)
+                for (lesson_id, skill_id), (acquired, not_acquired, untested) in counts.items()
+            ])
+
+    @classmethod
+    def apply_transitions(cls, transitions):
+        """Update the counters of the Lessons of the Students with status transitions of their StudentSkills
+
+        Only the Lessons whose stats are already computed are updated, the
+        others are computed when needed (see for_lesson).
+
+        :param transitions: (student_id, skill_id, status before, status after), see StudentSkill.status
+        """
+        student_lessons = {}
+        for student_id, lesson_id in Lesson.students.through.objects.filter(
+                student__in={x[0] for x in transitions}).values_list("student_id", "lesson_id"):
+            student_lessons.setdefault(student_id, []).append(lesson_id)
+
+        deltas = {}
+        for student_id, skill_id, before, after in transitions:
+            for lesson_id in student_lessons.get(student_id, ()):
+                delta = deltas.setdefault((lesson_id, skill_id), {})
+                if before is not None:
+                    delta[STATUS_COUNTERS[before]] = delta.get(STATUS_COUNTERS[before], 0) - 1
+                if after is not None:
+                    delta[STATUS_COUNTERS[after]] = delta.get(STATUS_COUNTERS[after], 0) + 1
+
+        if not deltas:
+            return
+
+        existing = set(cls.objects.filter(lesson__in={x[0] for x in deltas}).values_list("lesson_id", "skill_id"))
+        computed_lessons = {x[0] for x in existing}
+
+        # the same changes of the counters in a Lesson are made with a single UPDATE
+        updates, missing = {}, set()
+        for (lesson_id, skill_id), delta in deltas.items():
+            delta = tuple(sorted((field, number) for field, number in delta.items() if number))
+
+            if not delta or lesson_id not in computed_lessons:
+                continue
+
+            updates.setdefault((lesson_id, delta), []).append(skill_id)
+            if (lesson_id, skill_id) not in existing:
+                missing.add((lesson_id, skill_id))
+
+        with transaction.atomic():
+            if missing:
+                number_of_students = cls.number_of_students({x[0] for x in missing})
+
+                # the first StudentSkill of this Skill in the Lesson: nobody tested it before. The
+                # row may be created meanwhile for another Student, the changes are added to it
+                for lesson_id, skill_id in sorted(missing):
+                    cls.objects.get_or_create(lesson_id=lesson_id, skill_id=skill_id, defaults={
+                        "untested": number_of_students.get(lesson_id, 0),
+                    })
+
+            for (lesson_id, delta), skill_ids in updates.items():
+                cls.objects.filter(lesson=lesson_id, skill__in=skill_ids).update(
+                    **{field: F(field) + number for field, number in delta})
+
+    @classmethod
+    def rebuild(cls, lesson_ids=None):
+        """Compute again from scratch the stats of some Lessons, or all of them"""
+        if lesson_ids is None:
+            lesson_ids = list(Lesson.objects.values_list("id", flat=True))
+
+        with transaction.atomic():
+            cls.objects.filter(lesson__in=lesson_ids).delete()
+            cls.refresh(lesson_ids)
+
+    @classmethod
+    def check_consistency(cls, lesson_ids=None):
+        """Compare the stored stats with the StudentSkills, for the Lessons whose stats are computed
+
+        :returns: The differences: (lesson_id, skill_id, stored counts, live counts)
+        :rtype: list
+        """
+        stored = cls.objects.all()
+        if lesson_ids is not None:
+            stored = stored.filter(lesson__in=lesson_ids)
+
+        stored = {(x.lesson_id, x.skill_id): (x.acquired, x.not_acquired, x.untested) for x in stored}
+        lesson_ids = {x[0] for x in stored}
+        live = cls.aggregate(lesson_ids)
+        number_of_students = cls.number_of_students(lesson_ids)
+
+        differences = []
+        for lesson_id, skill_id in sorted(set(stored) | set(live)):
+            # without StudentSkill, no Student tested the Skill
+            untested = (0, 0, number_of_students.get(lesson_id, 0))
+            stored_counts = stored.get((lesson_id, skill_id), untested)
+            live_counts = live.get((lesson_id, skill_id), untested)
+
+            if stored_counts != live_counts:
+                differences.append((lesson_id, skill_id, stored_counts, live_counts))
+
+        return differences
+
+    @classmethod
+    def compute_first(cls, lesson_ids):
+        """Compute the stats of some Lessons the first time, unless another request computes them meanwhile"""
+        try:
+            with transaction.atomic():
+                cls.refresh(lesson_ids)
+        except IntegrityError:
+            # the rows inserted by the other request are used
+            pass
+
+    @classmethod
+    def for_lesson(cls, lesson):
+        """Get the stats of a Lesson by Skill id, computing them the first time"""
+        stats = {x.skill_id: x for x in cls.objects.filter(lesson=lesson)}
+
+        if not stats:
+            cls.compute_first([lesson.id])
+            stats = {x.skill_id: x for x in cls.objects.filter(lesson=lesson)}
+
+        return stats
+
+    @classmethod
+    def for_lesson_skill(cls, lesson, skill):
+        """Get the stats of a Lesson for a Skill, computing the stats of the Lesson the first time"""
+        stats = cls.objects.filter(lesson=lesson, skill=skill).first()
+
+        if stats is None and not cls.objects.filter(lesson=lesson).exists():
+            cls.compute_first([lesson.id])
+            stats = cls.objects.filter(lesson=lesson, skill=skill).first()
+
+        # no Student of the Lesson tested the Skill yet
+        if stats is None:
+            stats = cls(lesson=lesson, skill=skill, untested=lesson.students.count())
+
+        return stats
+
+
+@receiver(student_skills_changed)
+def update_lesson_skill_stats(sender, transitions, **kwargs):
+    LessonSkillStats.apply_transitions(transitions)
+
+
+@receiver(m2m_changed, sender=Lesson.students.through)
+def refresh_lesson_skill_stats_on_students_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # once cleared from the Student side, its Lessons are unknown
+        instance._cleared_lesson_ids = list(instance.lesson_set.values_list("id", flat=True))
+        return
+
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        LessonSkillStats.refresh([instance.id])
+    elif action == "post_clear":
+        LessonSkillStats.refresh(getattr(instance, "_cleared_lesson_ids", []))
+    else:
+        LessonSkillStats.refresh(list(pk_set))
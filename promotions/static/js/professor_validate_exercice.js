@@ -70,7 +70,8 @@ function validateExerciceController($scope, $http, $sce, $timeout, $location) {
                     window.location.href = "..";
                 }
 
-                $scope.yamlValidationResult = $sce.trustAsHtml('<div class="alert alert-success">L\'exercice a correctement été soumis, merci !<br />Vous pouvez le voir <a href="' + data.url + '" target="_blank">ici</a>.</div>');
+                var regradeMessage = data.regrade_pending ? '<br />Les réponses déjà données à cet exercice vont être corrigées à nouveau dans quelques minutes.' : '';
+                $scope.yamlValidationResult = $sce.trustAsHtml('<div class="alert alert-success">L\'exercice a correctement été soumis, merci !<br />Vous pouvez le voir <a href="' + data.url + '" target="_blank">ici</a>.' + regradeMessage + '</div>');
                 console.log(data);
 
                 $scope.yaml = "";
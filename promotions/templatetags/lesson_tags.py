@@ -7,7 +7,18 @@ register = template.Library()
 
 @register.simple_tag(takes_context=True)
 def get_students_skills(context, of_keyword, student, at_keyword, stage, as_keyword, target_name):
-    context[target_name] = StudentSkill.objects.filter(skill__in=stage.skills.all(), student=student).select_related("skill").order_by("skill__section", "skill__code")
+    # the StudentSkills of a Student and the Skills of a Stage are loaded once for the whole page
+    if "get_students_skills" not in context.render_context:
+        context.render_context["get_students_skills"] = {"students": {}, "stages": {}}
+    loaded = context.render_context["get_students_skills"]
+
+    if student.pk not in loaded["students"]:
+        loaded["students"][student.pk] = {x.skill_id: x for x in StudentSkill.objects.filter(student=student)}
+    if stage.pk not in loaded["stages"]:
+        loaded["stages"][stage.pk] = list(stage.skills.select_related("section").order_by("section", "code"))
+
+    # the Skills not tested yet have no StudentSkill, see StudentSkill.for_skills
+    context[target_name] = StudentSkill.for_skills(student, loaded["stages"][stage.pk], loaded["students"][student.pk])
     return ""
 
 
@@ -2,6 +2,12 @@ from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from users.models import Professor, Student
 from django.core.urlresolvers import reverse
+from django.utils import timezone
+
+from skills.models import Skill, StudentSkill
+
+from .enrollment import enroll_students, EnrollmentError
+from .models import Lesson, Stage, LessonSkillStats
 
 
 class PermissionsTest(TestCase):
@@ -51,3 +57,60 @@ class PageLoadTest(TestCase):
 
     def test_static_pages_load(self):
         self.assertEqual(self.c.get(reverse("professor:dashboard")).status_code, 200)
+
+
+class EnrollmentTest(TestCase):
+    def setUp(self):
+        self.lesson = Lesson.objects.create(name="Lesson", stage=Stage.objects.create(name="Stage", level=1))
+        User.objects.create(username="jean.dupont", email="used@example.org")
+
+    def test_homonyms(self):
+        students = enroll_students(self.lesson, [("Jean", "Dupont", None), ("Jean", "Dupont", None),
+                                                 ("Jean", "Dupont1", None)])
+
+        self.assertEqual([x.user.username for x in students], ["jean.dupont1", "jean.dupont2", "jean.dupont11"])
+        self.assertEqual([x.user.email for x in students],
+                         ["jean.dupont1@example.com", "jean.dupont2@example.com", "jean.dupont11@example.com"])
+        self.assertEqual(self.lesson.students.count(), 3)
+
+    def test_duplicated_email(self):
+        with self.assertRaises(EnrollmentError):
+            enroll_students(self.lesson, [("Jean", "Martin", "jean@example.org"),
+                                          ("Paul", "Martin", "jean@example.org")])
+
+        with self.assertRaises(EnrollmentError):
+            enroll_students(self.lesson, [("Jean", "Martin", None), ("Paul", "Martin", "used@example.org")])
+
+        self.assertFalse(Student.objects.exists())
+
+
+class LessonSkillStatsTest(TestCase):
+    def setUp(self):
+        self.lesson = Lesson.objects.create(name="Lesson", stage=Stage.objects.create(name="Stage", level=1))
+        self.students = [Student.objects.create(user=User.objects.create(username="student%s" % x)) for x in range(3)]
+        self.lesson.students.add(*self.students)
+        self.skill, self.other = [Skill.objects.create(code=x, name=x, description=x) for x in ("S1", "S2")]
+
+        StudentSkill.objects.create(student=self.students[0], skill=self.skill, tested=timezone.now())
+
+    def counts(self, skill):
+        stats = LessonSkillStats.objects.get(lesson=self.lesson, skill=skill)
+        return stats.acquired, stats.not_acquired, stats.untested
+
+    def test_for_lesson(self):
+        self.assertEqual(set(LessonSkillStats.for_lesson(self.lesson)), {self.skill.id})
+        self.assertEqual(self.counts(self.skill), (0, 1, 2))
+
+    def test_first_student_skill(self):
+        LessonSkillStats.for_lesson(self.lesson)
+
+        # the row of a Skill tested for the first time in the Lesson starts from nobody tested
+        LessonSkillStats.apply_transitions([(self.students[1].id, self.other.id, "unknown", "acquired")])
+        self.assertEqual(self.counts(self.other), (1, 0, 2))
+
+        LessonSkillStats.apply_transitions([
+            (self.students[1].id, self.other.id, "acquired", "not acquired"),
+            (self.students[2].id, self.other.id, "unknown", "acquired"),
+        ])
+        self.assertEqual(self.counts(self.other), (1, 1, 1))
+        self.assertEqual(self.counts(self.skill), (0, 1, 2))
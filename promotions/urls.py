@@ -21,6 +21,10 @@ urlpatterns = [
     url(r'^lesson/(?P<pk>\d+)/update/$', views.lesson_update, name='lesson_update'),
     url(r'^lesson/(?P<pk>\d+)/delete/$', user_is_professor(LessonDelete.as_view()), name='lesson_delete'),
 
+    url(r'^lesson/(?P<pk>\d+)/grading_queue/$', views.lesson_grading_queue, name='lesson_grading_queue'),
+    url(r'^lesson/(?P<pk>\d+)/analytics/$', views.lesson_analytics, name='lesson_analytics'),
+    url(r'^lesson/(?P<pk>\d+)/analytics/export\.(?P<format>csv|xlsx)$', views.lesson_analytics_export, name='lesson_analytics_export'),
+
     # TODO : Delete lesson_student_list and its template
     url(r'^lesson/(?P<pk>\d+)/student/$', user_is_professor(LessonStudentListView.as_view()), name='lesson_student_list'),
     url(r'^lesson/(?P<pk>\d+)/student/add/$', views.lesson_student_add, name='lesson_student_add'),
@@ -47,9 +51,9 @@ urlpatterns = [
     url(r'^pedagogical/(?P<type>.+)/(?P<id>.+)/$', views.update_pedagogical_ressources, name='update_pedagogical_ressources'),
     url(r'^skill_tree/$', user_is_professor(ListView.as_view(model=Skill, template_name="professor/skill/tree.haml")), name='skill_tree'),
 
-    url(r'^lesson/(?P<lesson_pk>\d+)/validate_skill/(?P<student_skill>\d+)/$', views.validate_student_skill, name='validate_student_skill'),
-    url(r'^lesson/(?P<lesson_pk>\d+)/unvalidate_skill/(?P<student_skill>\d+)/$', views.unvalidate_student_skill, name='unvalidate_student_skill'),
-    url(r'^lesson/(?P<lesson_pk>\d+)/default_skill/(?P<student_skill>\d+)/$', views.default_student_skill, name='default_student_skill'),
+    url(r'^lesson/(?P<lesson_pk>\d+)/validate_skill/(?P<student_pk>\d+)/(?P<skill_pk>\d+)/$', views.validate_student_skill, name='validate_student_skill'),
+    url(r'^lesson/(?P<lesson_pk>\d+)/unvalidate_skill/(?P<student_pk>\d+)/(?P<skill_pk>\d+)/$', views.unvalidate_student_skill, name='unvalidate_student_skill'),
+    url(r'^lesson/(?P<lesson_pk>\d+)/default_skill/(?P<student_pk>\d+)/(?P<skill_pk>\d+)/$', views.default_student_skill, name='default_student_skill'),
 
     url(r'^lesson_tests_and_skills/(?P<lesson_id>\d+).json$', views.lesson_tests_and_skills, name='lesson_tests_and_skills'),
 
@@ -31,25 +31,29 @@ from django.http import HttpResponseRedirect, HttpResponse, HttpResponseBadReque
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import render, get_object_or_404, resolve_url
 from django.core.urlresolvers import reverse
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib import messages
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.models import User
 from django.contrib.auth.views import redirect_to_login
 from django.views.decorators.http import require_POST
 from django.db import transaction
-from django.db.models import Count, Q
+from django.db.models import Count
 
-from skills.models import Skill, StudentSkill, CodeR, Section, Relations, CodeR_relations
+from skills.models import Skill, StudentSkill, CodeR, Section
+from resources.listing import get_resource_listing
 from resources.models import KhanAcademy, Sesamath, Resource
 from examinations.models import Test, TestStudent, BaseTest, TestExercice, Context, List_question, Question, Answer, \
-    TestFromClass
+    TestFromClass, prefetch_questions
 from users.models import Student
 from examinations.validate import validate_exercice_yaml_structure
 
-from .models import Lesson, Stage
+from .models import Lesson, Stage, LessonSkillStats
+from .analytics import LessonAnalytics, ANALYTICS_TABLES
+from .enrollment import enroll_students, EnrollmentError
 from .forms import LessonForm, StudentAddForm, SyntheseForm, KhanAcademyForm, StudentUpdateForm, LessonUpdateForm, \
     TestUpdateForm, SesamathForm, ResourceForm, CSVForm
-from .utils import generate_random_password, user_is_professor, force_encoding
+from .utils import user_is_professor, force_encoding
 import csv
 from django.http import JsonResponse
 
@@ -82,42 +86,15 @@ def lesson_detail(request, pk):
 
     number_of_students = lesson.students.count()
 
-    skill_to_student_skill = {}
-    for student_skill in StudentSkill.objects.filter(student__lesson=lesson).select_related("skill"):
-        skill_to_student_skill.setdefault(student_skill.skill, list()).append(student_skill)
-
     skills_to_heatmap_class = {}
 
-    if lesson.students.count():
-        try:
-            skills = []
-            for stage in lesson.stages_in_unchronological_order():
-                skills.extend([x for x in stage.skills.all().order_by('-code')])
-
-            for skill in skills:
-                mastered = len([x for x in skill_to_student_skill[skill] if x.acquired])
-                not_mastered = len([x for x in skill_to_student_skill[skill] if not x.acquired and x.tested])
-                total = mastered + not_mastered
+    if number_of_students:
+        lesson_skill_stats = LessonSkillStats.for_lesson(lesson)
 
-                # normally number_of_students will never be equal to 0 in this loop
-                if total == 0:
-                    skill.heatmap_class = "mastered_not_enough"
-                    continue
-
-                percentage = (float(mastered) / total) if total else 0
-
-                if percentage < 0.25:
-                    skills_to_heatmap_class[skill] = "mastered_25"
-                elif percentage < 0.5:
-                    skills_to_heatmap_class[skill] = "mastered_50"
-                elif percentage < 0.75:
-                    skills_to_heatmap_class[skill] = "mastered_75"
-                else:
-                    skills_to_heatmap_class[skill] = "mastered_100"
-        except Exception as e:
-            traceback.print_exc(file=sys.stdout)
-            print e
-            print "Error: could no calculate heatmap"
+        for stage in lesson.stages_in_unchronological_order():
+            for skill in stage.skills.all():
+                if skill.id in lesson_skill_stats:
+                    skills_to_heatmap_class[skill] = lesson_skill_stats[skill.id].get_heatmap_class()
 
     return render(request, "professor/lesson/detail.haml", {
         "lesson": lesson,
@@ -126,6 +103,125 @@ def lesson_detail(request, pk):
     })
 
 
+@user_is_professor
+def lesson_analytics(request, pk):
+    """
+    Get the analytics of a Lesson: difficulty of the Skills, success of the Questions and progress of the Students
+
+    :param request:
+    :param pk: primary key of a Lesson
+    :return:
+    """
+    lesson = get_object_or_404(Lesson, pk=pk)
+    tables = LessonAnalytics(lesson).tables()
+
+    # the rows of each table, without NaN for the template
+    rows = {name: table.astype(object).where(pd.notnull(table), None).to_dict("records")
+            for name, table in tables.items()}
+
+    return render(request, "professor/lesson/analytics.haml", {
+        "lesson": lesson,
+        "students": rows["students"],
+        "skills": rows["skills"],
+        "questions": rows["questions"],
+        "acquisitions": rows["acquisitions"],
+    })
+
+
+@user_is_professor
+def lesson_analytics_export(request, pk, format):
+    """
+    Export the analytics of a Lesson: a table (?table=) in CSV, or all of them in XLSX
+
+    :param request:
+    :param pk: primary key of a Lesson
+    :param format: "csv" or "xlsx"
+    :return:
+    """
+    lesson = get_object_or_404(Lesson, pk=pk)
+    analytics = LessonAnalytics(lesson)
+
+    if format == "csv":
+        table = request.GET.get("table", "skills")
+        if table not in ANALYTICS_TABLES:
+            return HttpResponseBadRequest("Unknown table: %s" % table)
+
+        response = HttpResponse(analytics.to_csv(table), content_type="text/csv")
+        filename = "%s-%s.csv" % (lesson.pk, table)
+    else:
+        response = HttpResponse(analytics.to_xlsx(),
+                                content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        filename = "%s.xlsx" % lesson.pk
+
+    response["Content-Disposition"] = "attachment; filename=analytics-%s" % filename
+    return response
+
+
+GRADING_QUEUE_PAGE_SIZE = 20
+"""The number of Answers to assess shown by page"""
+
+
+@user_is_professor
+def lesson_grading_queue(request, pk):
+    """
+    List the Answers of the Students of a Lesson waiting for the assessment of the Professor, oldest first
+
+    :param request:
+    :param pk: primary key of a Lesson
+    :return:
+    """
+    lesson = get_object_or_404(Lesson, pk=pk)
+
+    tests = Test.objects.filter(lesson=lesson, pending_professor_review__gt=0).order_by("created_at")
+
+    answers = Answer.objects.filter(
+        test_student__test__lesson=lesson,
+        pending_professor_review__gt=0,
+    ).select_related(
+        "test_student__student__user",
+        "test_student__test",
+        "test_exercice__skill",
+        "test_exercice__exercice",
+    ).order_by("answer_datetime", "id")
+
+    test = tests.filter(pk=request.GET.get("test")).first() if request.GET.get("test", "").isdigit() else None
+    if test is not None:
+        answers = answers.filter(test_student__test=test)
+
+    paginator = Paginator(answers, GRADING_QUEUE_PAGE_SIZE)
+    try:
+        page = paginator.page(request.GET.get("page", 1))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+
+    # the Questions of the Contexts of the page, in a single query (see Context.get_questions for their order)
+    context_questions = {}
+    for list_question in List_question.objects.filter(
+            context__in={x.test_exercice.exercice_id for x in page}).select_related("question"):
+        context_questions.setdefault(list_question.context_id, []).append(list_question.question)
+
+    # the responses to assess of each Answer: (index, question, response)
+    answers_to_assess = []
+    for answer in page:
+        responses = answer.get_answers()
+        answers_to_assess.append((answer, [
+            (index, question, responses[str(index)]["response"])
+            for index, question in enumerate(context_questions.get(answer.test_exercice.exercice_id, []))
+            if str(index) in responses and responses[str(index)]["correct"] == -1
+        ]))
+
+    return render(request, "professor/lesson/grading_queue.haml", {
+        "lesson": lesson,
+        "tests": tests,
+        "test": test,
+        "page": page,
+        "pagination_extra": "test=%s" % test.pk if test is not None else "",
+        "answers_to_assess": answers_to_assess,
+    })
+
+
 @user_is_professor
 def lesson_add(request):
     """
@@ -204,50 +300,41 @@ def lesson_student_add(request, pk):
 
                 names = izip(last_name_column, first_name_column)
 
+                new_students = []
                 line_number = 2
                 for last_name,first_name in names:
-                    # We use this form to create at the same time the username
+                    # We use this form to validate the names
                     newStudent = StudentAddForm({
                         "first_name": last_name,
                         "last_name": first_name,
                     })
 
                     if not newStudent.is_valid():
-                        messages.add_message(request, messages.ERROR,
-                                             'Erreur : l\'utilisateur à la ligne ' + str(line_number) +
-                                             ' n\' a pas de nom ou de prénom. Uniquement les élèves des lignes '
-                                             'précédentes ont été importés.')
+                        try:
+                            enroll_students(lesson, new_students)
+                        except EnrollmentError as e:
+                            messages.add_message(request, messages.ERROR, unicode(e))
+                        else:
+                            messages.add_message(request, messages.ERROR,
+                                                 'Erreur : l\'utilisateur à la ligne ' + str(line_number) +
+                                                 ' n\' a pas de nom ou de prénom. Uniquement les élèves des lignes '
+                                                 'précédentes ont été importés.')
                         return render(request, "professor/lesson/student/add.haml", {
                             "lesson": lesson,
                         })
 
-                    first_name = newStudent.cleaned_data["first_name"]
-                    last_name = newStudent.cleaned_data["last_name"]
-                    username = newStudent.generate_student_username()
-                    email = newStudent.get_or_generate_email(username)
-
-                    with transaction.atomic():
-                        user = User.objects.create_user(username=username,
-                                                        email=email,
-                                                        password=generate_random_password(15),
-                                                        first_name=first_name,
-                                                        last_name=last_name)
-                        student = Student.objects.create(user=user)
-                        student.lesson_set.add(lesson)
-                        # send signal to tell a student was added to a lesson ; default signal not working
-                        student_added_to_lesson.send(sender=Lesson, student=student, level=lesson.stage.level)
-
-                        for stage in lesson.stages_in_unchronological_order():
-                            for skill in stage.skills.all():
-                                StudentSkill.objects.create(
-                                    student=student,
-                                    skill=skill,
-                                )
-
-                        for test in Test.objects.filter(lesson=lesson, running=True):
-                            test.add_student(student)
-
-                        line_number += 1
+                    new_students.append((newStudent.cleaned_data["first_name"],
+                                         newStudent.cleaned_data["last_name"],
+                                         newStudent.cleaned_data["email"]))
+                    line_number += 1
+
+                try:
+                    enroll_students(lesson, new_students)
+                except EnrollmentError as e:
+                    messages.add_message(request, messages.ERROR, unicode(e))
+                    return render(request, "professor/lesson/student/add.haml", {
+                        "lesson": lesson, })
+
                 if line_number == 2:
                     messages.add_message(request, messages.ERROR, 'Erreur : le fichier ne contient pas d\'élèves.')
                     return render(request, "professor/lesson/student/add.haml", {
@@ -261,6 +348,7 @@ def lesson_student_add(request, pk):
                                  str(line_number - 2) + ' utilisateur(s) a/ont été importé(s) avec succès.')
 
         elif 'last_name_0' in request.POST:
+            new_students = []
             for i in filter(lambda x: x.startswith("first_name_"), request.POST.keys()):
                 number = i.split("_")[-1]
                 form = StudentAddForm({
@@ -272,32 +360,17 @@ def lesson_student_add(request, pk):
                     print "ERROR: on student entry with number %s" % number, form.errors
                     continue
 
-                first_name = form.cleaned_data["first_name"]
-                last_name = form.cleaned_data["last_name"]
-                username = form.generate_student_username()
-                email = form.get_or_generate_email(username)
+                new_students.append((form.cleaned_data["first_name"],
+                                     form.cleaned_data["last_name"],
+                                     form.cleaned_data["email"]))
 
-                with transaction.atomic():
-                    user = User.objects.create_user(username=username,
-                                                    email=email,
-                                                    password=generate_random_password(15),
-                                                    first_name=first_name,
-                                                    last_name=last_name)
-
-                    student = Student.objects.create(user=user)
-                    student.lesson_set.add(lesson)
-                    # send signal to tell a student was added to a lesson ; default signal not working
-                    student_added_to_lesson.send(sender=Lesson, student=student, level=lesson.stage.level)
-
-                    for stage in lesson.stages_in_unchronological_order():
-                        for skill in stage.skills.all():
-                            StudentSkill.objects.create(
-                                student=student,
-                                skill=skill,
-                            )
-
-                    for test in Test.objects.filter(lesson=lesson, running=True):
-                        test.add_student(student)
+            try:
+                enroll_students(lesson, new_students)
+            except EnrollmentError as e:
+                messages.add_message(request, messages.ERROR, unicode(e))
+                return render(request, "professor/lesson/student/add.haml", {
+                    "lesson": lesson,
+                })
 
         return HttpResponseRedirect(reverse("professor:lesson_detail", args=(lesson.pk,)))
 
@@ -371,10 +444,14 @@ def lesson_student_test_detail(request, pk, lesson_pk, test_pk):
     student = get_object_or_404(Student, pk=pk)
     student_test = get_object_or_404(TestStudent, pk=test_pk)
 
+    answers = student_test.answer_set.select_related("test_exercice__exercice", "test_exercice__skill").prefetch_related(
+        prefetch_questions("test_exercice__exercice__list_question_set"))
+
     return render(request, "professor/lesson/student/test/detail.haml", {
         "lesson": get_object_or_404(Lesson, pk=lesson_pk),
         "student": student,
         "student_test": student_test,
+        "answers": list(answers),
     })
 
 
@@ -472,18 +549,8 @@ def professor_test_add_skill(request):
         # In order to do that, we search for an exercice to provide by default
         # If none exists, we will leave it blank
 
-        # Gather exercices related to the Skill concerned
-        exercices = skill.context_set.filter(approved=True, testable_online=True)
-
-        # Gather exercices for identical Skills to the Skill concerned
-        identical_to_skills = Relations.objects.filter(
-            relation_type="identic_to", from_skill=skill)
-        identical_from_skills = Relations.objects.filter(
-            relation_type="identic_to", to_skill=skill)
-        for relation in identical_to_skills:
-            exercices = exercices | relation.to_skill.context_set.filter(approved=True, testable_online=True)
-        for relation in identical_from_skills:
-            exercices = exercices | relation.from_skill.context_set.filter(approved=True, testable_online=True)
+        # Gather exercices related to the Skill concerned and to the Skills identical to it
+        exercices = Context.objects.for_skill_equivalents(skill).filter(approved=True, testable_online=True)
 
         # If no exercice exists, we will leave it blank and the user will have to create one
         if not exercices.exists():
@@ -492,11 +559,7 @@ def professor_test_add_skill(request):
                 test.save()
 
             # We check if an offline exercice is available instead
-            exercices = skill.context_set.filter(approved=True, testable_online=False)
-            for relation in identical_to_skills:
-                exercices = exercices | relation.to_skill.context_set.filter(approved=True, testable_online=False)
-            for relation in identical_from_skills:
-                exercices = exercices | relation.from_skill.context_set.filter(approved=True, testable_online=False)
+            exercices = Context.objects.for_skill_equivalents(skill).filter(approved=True, testable_online=False)
 
             if not exercices.exists():
                 with transaction.atomic():
@@ -641,21 +704,24 @@ def lesson_skill_detail(request, lesson_pk, skill_code):
     """
     lesson = get_object_or_404(Lesson, pk=lesson_pk)
     skill = get_object_or_404(Skill, code=skill_code)
-    student_skills = StudentSkill.objects.filter(student__lesson=lesson, skill=skill).order_by(
-        "student__user__last_name", "student__user__first_name")
+    # the Students without StudentSkill did not test the Skill yet
+    existing = {x.student_id: x for x in StudentSkill.objects.filter(student__lesson=lesson, skill=skill)}
+    student_skills = []
+    for student in lesson.students.order_by("user__last_name", "user__first_name"):
+        student_skill = existing.get(student.id) or StudentSkill(skill=skill)
+        student_skill.student = student
+        student_skills.append(student_skill)
 
-    number_of_students = student_skills.count()
-    number_acquired = student_skills.filter(acquired__isnull=False).count()
-    number_not_acquired = student_skills.filter(acquired__isnull=True, tested__isnull=False).count()
+    stats = LessonSkillStats.for_lesson_skill(lesson, skill)
 
     return render(request, "professor/lesson/skill/detail.haml", {
         "lesson": lesson,
         "skill": skill,
         "student_skills": student_skills,
-        "number_of_students": number_of_students,
-        "number_acquired": number_acquired,
-        "number_not_acquired": number_not_acquired,
-        "number_not_tested": number_of_students - number_acquired - number_not_acquired,
+        "number_of_students": stats.acquired + stats.not_acquired + stats.untested,
+        "number_acquired": stats.acquired,
+        "number_not_acquired": stats.not_acquired,
+        "number_not_tested": stats.untested,
     })
 
 
@@ -806,244 +872,22 @@ def update_pedagogical_ressources(request, type, id):
     KhanAcademy_form = KhanAcademyForm()
     Sesamath_form = SesamathForm()
 
-    personal_resource = base.resource.filter(section="personal_resource")
-    lesson_resource = base.resource.filter(section="lesson_resource")
-    exercice_resource = base.resource.filter(section="exercice_resource")
-    other_resource = base.resource.filter(section="other_resource")
-
-    exercice_resource_sesamath = list()
-    lesson_resource_sesamath = list()
-    lesson_resource_khanacademy = list()
-
-    sori_skills_lesson_resources = list()
-    sori_skills_exercice_resources = list()
-    sori_skills_other_resources = list()
-
-    sori_skills_lesson_resource_sesamath = list()
-    sori_skills_lesson_resource_khanacademy = list()
-    sori_skills_exercice_resource_sesamath = list()
-
-    sori_coder_lesson_resources = list()
-    sori_coder_exercice_resources = list()
-    sori_coder_other_resources = list()
-
-    sori_coder_lesson_resource_sesamath = list()
-    sori_coder_lesson_resource_khanacademy = list()
-    sori_coder_exercice_resource_sesamath = list()
-
-    # Sorting the different type of resources by category (personal, lesson, exercice or other)
-    # and by type (khanacademy, sesamath or other)
-
-    for exo in lesson_resource:
-        if exo.content.get('from') and exo.content['from'] == "skills_sesamathskill":
-            resource = get_object_or_404(Sesamath, pk=exo.content['referenced'])
-            lesson_resource_sesamath.append([exo.pk, resource])
-            lesson_resource = lesson_resource.exclude(pk=exo.pk)
-
-        elif exo.content.get('from') and exo.content['from'] == "skills_khanacademyvideoskill":
-            resource = get_object_or_404(KhanAcademy, pk=exo.content['referenced'])
-            lesson_resource_khanacademy.append([exo.pk, resource])
-            lesson_resource = lesson_resource.exclude(pk=exo.pk)
-
-    for exo in exercice_resource:
-        if exo.content.get('from') and exo.content['from'] == "skills_sesamathskill":
-            resource = get_object_or_404(Sesamath, pk=exo.content['referenced'])
-            exercice_resource_sesamath.append([exo.pk, resource])
-            exercice_resource = exercice_resource.exclude(pk=exo.pk)
-
-    # Do the same operation for similar or identical resources :
-    # Some Skill or CodeR can be similar or identical to other Skill or CodeR
-    # We have to display the resources of those as well
-
-    # We achieve this only if we have either a Skill or a CodeR.
-    # If it is a Section, we don't display the similar/identical resources
-    # First step : is base a Skill or a CodeR ?
-    if isinstance(base, Skill):
-        # Begin with the Skills, same step is done for CodeR a bit further
-
-        # Retrieve all the similar and identical Relations for Skills
-        skills_from = Relations.objects.filter(Q(relation_type__in=['similar_to', 'identic_to'], from_skill=base.id))
-        skills_to = Relations.objects.filter(Q(relation_type__in=['similar_to', 'identic_to'], to_skill=base.id))
-
-        # This list will gather all the similar or 'identic' Skills
-        # (similar_or_identic = sori)
-        sori_skills = list()
-        for skill_from in skills_from:
-            sori_skills.append(skill_from.to_skill)
-        for skill_to in skills_to:
-            sori_skills.append(skill_to.from_skill)
-
-        # Get the associated resources for these Skills
-        # We need to keep them separated by section to ease their use in the template
-
-        for skill in sori_skills:
-            lesson = skill.resource.filter(section="lesson_resource")
-            if lesson:
-                sori_skills_lesson_resources.append([skill, lesson])
-            exercice = skill.resource.filter(section="exercice_resource")
-            if exercice:
-                sori_skills_exercice_resources.append([skill, exercice])
-            other = skill.resource.filter(section="other_resource")
-            if other:
-                sori_skills_other_resources.append([skill, other])
-
-        # sori_skills_lesson_resources has resources of different types, we need to distinguish them
-        for skill in sori_skills_lesson_resources:
-            # Lists to regroup resources together
-            sesamath_list = list()
-            khan_list = list()
-
-            for res in skill[1]:
-                if res.content.get('from') and res.content['from'] == "skills_sesamathskill":
-                    resource = get_object_or_404(Sesamath, pk=res.content['referenced'])
-                    sesamath_list.append([res.pk, resource])
-                    skill[1] = skill[1].exclude(pk=res.pk)
-
-                elif res.content.get('from') and res.content['from'] == "skills_khanacademyvideoskill":
-                    resource = get_object_or_404(KhanAcademy, pk=res.content['referenced'])
-                    khan_list.append([res.pk, resource])
-                    skill[1] = skill[1].exclude(pk=res.pk)
-
-            # If we have emptied the ressources in the Skill, we remove it from the list
-            if not skill[1]:
-                sori_skills_lesson_resources.remove(skill)
-
-            # Once resources are sorted, we can add them with the associated Skill
-            if sesamath_list:
-                sori_skills_lesson_resource_sesamath.append([skill[0], sesamath_list])
-            if khan_list:
-                sori_skills_lesson_resource_khanacademy.append([skill[0], khan_list])
-
-        # sori_skills_exercice_resources has resources of different types, we need to distinguish them
-        for skill in sori_skills_exercice_resources:
-            # List to regroup resources together
-            sesamath_list = list()
-
-            for res in skill[1]:
-                if res.content.get('from') and res.content['from'] == "skills_sesamathskill":
-                    resource = get_object_or_404(Sesamath, pk=res.content['referenced'])
-                    sesamath_list.append([res.pk, resource])
-                    skill[1] = skill[1].exclude(pk=res.pk)
-
-            # If we have emptied the ressources in the Skill, we remove it from the list
-            if not skill[1]:
-                sori_skills_exercice_resources.remove(skill)
-
-            # Once resources are sorted, we can add them with the associated Skill
-            if sesamath_list:
-                sori_skills_exercice_resource_sesamath.append([skill[0], sesamath_list])
-
-    if isinstance(base, CodeR) or isinstance(base, Skill):
-        # Repeat this operation for the CodeR
-        # TODO : Group these steps as a function for Skill and CodeR
-        # Retrieve all the CodeR related to the current Skill or to the current CodeR
-
-        if isinstance(base, Skill):
-            related_coder = CodeR.objects.filter(skill=base.id)
-        else:
-            coder_from = CodeR_relations.objects.filter(
-                Q(relation_type__in=['similar_to', 'identic_to'], from_coder=base.id))
-            coder_to = CodeR_relations.objects.filter(
-                Q(relation_type__in=['similar_to', 'identic_to'], to_coder=base.id))
-
-            # This list will gather all the similar or 'identic' CodeR
-            related_coder = list()
-            for coder_from in coder_from:
-                related_coder.append(coder_from.to_coder)
-            for coder_to in coder_to:
-                related_coder.append(coder_to.from_coder)
-                # Case where we look for CodeR similar or identic to a CodeR
-
-        # Get the associated resources for these CodeR
-
-        for coder in related_coder:
-            lesson = coder.resource.filter(section="lesson_resource")
-            if lesson:
-                sori_coder_lesson_resources.append([coder, lesson])
-            exercice = coder.resource.filter(section="exercice_resource")
-            if exercice:
-                sori_coder_exercice_resources.append([coder, exercice])
-            other = coder.resource.filter(section="other_resource")
-            if other:
-                sori_coder_other_resources.append([coder, other])
-
-        # sori_skills_lesson_resources has resources of different types, we need to distinguish them
-        for coder in sori_coder_lesson_resources:
-            # Lists to regroup resources together
-            sesamath_list = list()
-            khan_list = list()
-
-            for res in coder[1]:
-                if res.content.get('from') and res.content['from'] == "skills_sesamathskill":
-                    resource = get_object_or_404(Sesamath, pk=res.content['referenced'])
-                    sesamath_list.append([res.pk, resource])
-                    coder[1] = coder[1].exclude(pk=res.pk)
-
-                elif res.content.get('from') and res.content['from'] == "skills_khanacademyvideoskill":
-                    resource = get_object_or_404(KhanAcademy, pk=res.content['referenced'])
-                    khan_list.append([res.pk, resource])
-                    coder[1] = coder[1].exclude(pk=res.pk)
-
-            # If we have emptied the ressources in the Skill, we remove it from the list
-            if not coder[1]:
-                sori_coder_lesson_resources.remove(coder)
-
-            # Once resources are sorted, we can add them with the associated Skill
-            if sesamath_list:
-                sori_coder_lesson_resource_sesamath.append([coder[0], sesamath_list])
-            if khan_list:
-                sori_coder_lesson_resource_khanacademy.append([coder[0], khan_list])
-
-        # sori_coder_exercice_resources has resources of different types, we need to distinguish them
-        for coder in sori_coder_exercice_resources:
-            # List to regroup resources together
-            sesamath_list = list()
-
-            for res in coder[1]:
-                if res.content.get('from') and res.content['from'] == "skills_sesamathskill":
-                    resource = get_object_or_404(Sesamath, pk=res.content['referenced'])
-                    sesamath_list.append([res.pk, resource])
-                    coder[1] = coder[1].exclude(pk=res.pk)
-
-            # If we have emptied the ressources in the CodeR, we remove it from the list
-            if not coder[1]:
-                sori_coder_exercice_resources.remove(coder)
-
-            # Once resources are sorted, we can add them with the associated CodeR
-            if sesamath_list:
-                sori_coder_exercice_resource_sesamath.append([coder[0], sesamath_list])
-
     sesamath_references_manuals = Sesamath.objects.filter(ressource_kind__iexact="Manuel")
     sesamath_references_cahiers = Sesamath.objects.filter(ressource_kind__iexact="Cahier")
 
-    return render(request, "professor/skill/update_pedagogical_resources.haml", {
+    context = {
         "sesamath_references_manuals": sesamath_references_manuals,
         "sesamath_references_cahier": sesamath_references_cahiers,
         "base": base,
-        "personal_resources": personal_resource,
-        "other_resources": other_resource,
-        "exercice_resources": exercice_resource,
-        "exercice_resource_sesamath": exercice_resource_sesamath,
-        "lesson_resources": lesson_resource,
-        "lesson_resource_sesamath": lesson_resource_sesamath,
-        "lesson_resource_khanacademy": lesson_resource_khanacademy,
         "resource_form": resource_form,
         "KhanAcademy_form": KhanAcademy_form,
         "sesamath_reference_form": Sesamath_form,
         "type": type,
-        "sori_skills_exercice_resources": sori_skills_exercice_resources,
-        "sori_skills_lesson_resources": sori_skills_lesson_resources,
-        "sori_skills_other_resources": sori_skills_other_resources,
-        "sori_skills_lesson_resource_sesamath": sori_skills_lesson_resource_sesamath,
-        "sori_skills_lesson_resource_khanacademy": sori_skills_lesson_resource_khanacademy,
-        "sori_skills_exercice_resource_sesamath": sori_skills_exercice_resource_sesamath,
-        "sori_coder_exercice_resources": sori_coder_exercice_resources,
-        "sori_coder_lesson_resources": sori_coder_lesson_resources,
-        "sori_coder_other_resources": sori_coder_other_resources,
-        "sori_coder_lesson_resource_sesamath": sori_coder_lesson_resource_sesamath,
-        "sori_coder_lesson_resource_khanacademy": sori_coder_lesson_resource_khanacademy,
-        "sori_coder_exercice_resource_sesamath": sori_coder_exercice_resource_sesamath,
-    })
+    }
+    # the Resources of base and of the related Skills or CodeR, by section and by type
+    context.update(get_resource_listing(base))
+
+    return render(request, "professor/skill/update_pedagogical_resources.haml", context)
 
     # TODO : TO DELETE
     """
@@ -1218,19 +1062,21 @@ def remove_pedagogical_ressources(request, type, id_type, kind, id):
 
 @require_POST
 @user_is_professor
-def validate_student_skill(request, lesson_pk, student_skill):
+def validate_student_skill(request, lesson_pk, student_pk, skill_pk):
     """
     Validate a Skill for a Student
 
     :param request:
     :param lesson_pk: primary key of a Lesson
-    :param student_skill: id of a StudentSkill
+    :param student_pk: primary key of a Student
+    :param skill_pk: primary key of a Skill
     :return: 
     """
     # TODO: a professor can only do this on one of his students
     lesson = get_object_or_404(Lesson, pk=lesson_pk)
 
-    student_skill = get_object_or_404(StudentSkill, id=student_skill)
+    student_skill = StudentSkill.get_or_untested(get_object_or_404(Student, pk=student_pk),
+                                                 get_object_or_404(Skill, pk=skill_pk))
 
     student_skill.validate(
         who=request.user,
@@ -1244,19 +1090,21 @@ def validate_student_skill(request, lesson_pk, student_skill):
 
 @require_POST
 @user_is_professor
-def unvalidate_student_skill(request, lesson_pk, student_skill):
+def unvalidate_student_skill(request, lesson_pk, student_pk, skill_pk):
     """
     Invalidate a Skill for a Student
 
     :param request:
     :param lesson_pk: primary key of a Lesson
-    :param student_skill: id of a StudentSkill
+    :param student_pk: primary key of a Student
+    :param skill_pk: primary key of a Skill
     :return: 
     """
     # TODO: a professor can only do this on one of his students
     lesson = get_object_or_404(Lesson, pk=lesson_pk)
 
-    student_skill = get_object_or_404(StudentSkill, id=student_skill)
+    student_skill = StudentSkill.get_or_untested(get_object_or_404(Student, pk=student_pk),
+                                                 get_object_or_404(Skill, pk=skill_pk))
 
     student_skill.unvalidate(
         who=request.user,
@@ -1270,19 +1118,21 @@ def unvalidate_student_skill(request, lesson_pk, student_skill):
 
 @require_POST
 @user_is_professor
-def default_student_skill(request, lesson_pk, student_skill):
+def default_student_skill(request, lesson_pk, student_pk, skill_pk):
     """
     Set a default value for a Student's Skill
 
     :param request:
     :param lesson_pk: primary key of a Lesson
-    :param student_skill: id of a StudentSkill
+    :param student_pk: primary key of a Student
+    :param skill_pk: primary key of a Skill
     :return: 
     """
     # TODO: a professor can only do this on one of his students
     lesson = get_object_or_404(Lesson, pk=lesson_pk)
 
-    student_skill = get_object_or_404(StudentSkill, id=student_skill)
+    student_skill = StudentSkill.get_or_untested(get_object_or_404(Student, pk=student_pk),
+                                                 get_object_or_404(Skill, pk=skill_pk))
 
     student_skill.default(
         who=request.user,
@@ -1517,7 +1367,7 @@ def exercice_validation_form_submit(request, pk=None):
 
     # Then, Question(s) creation, and links in List_question with the Context created
     if testable_online:
-        for question in data["questions"]:
+        for position, question in enumerate(data["questions"]):
             new_question_answers = None
 
             if question["type"] == "text":
@@ -1580,13 +1430,18 @@ def exercice_validation_form_submit(request, pk=None):
                 link = List_question.objects.create(
                     context_id=exercice.id,
                     question_id=new_question.id,
+                    position=position,
                 )
 
-
+        # The Answers already given to a modified Context are graded again with the new Questions,
+        # in the background (see the regrade_pending_contexts command)
+        if pk is not None:
+            Context.objects.filter(pk=exercice.pk).update(regrade_requested_by=request.user)
 
     return HttpResponse(json.dumps({
         "url": reverse('professor:exercice_detail', args=(exercice.id,)),
         "id": exercice.id,
+        "regrade_pending": testable_online and pk is not None,
     }))
 
 
@@ -1681,17 +1536,18 @@ def exercice_update_json(request, pk):
     for question in context.get_questions():
         # Each question has a answer field, which is a text formatted with YAML,
         # containing a type and its (true/false) answers attached to it
-        question_type = question.get_answer()["type"]
+        answer = question.get_answer()
+        question_type = answer["type"]
         answers = None
 
         if question_type == "graph":
-            answers = question.get_answer()["answers"]
+            answers = answer["answers"]
         elif question_type == "professor":
             answers = ""
-        elif isinstance(question.get_answer()["answers"], list):
-            answers = [{"text": key, "correct": True} for key in question.get_answer()["answers"]]
+        elif isinstance(answer["answers"], list):
+            answers = [{"text": key, "correct": True} for key in answer["answers"]]
         else:  # assuming dict
-            answers = [{"text": key, "correct": value} for key, value in question.get_answer()["answers"].items()]
+            answers = [{"text": key, "correct": value} for key, value in answer["answers"].items()]
 
         questions.append({
             "instructions": question.description,
@@ -1764,11 +1620,12 @@ def exercice_adapt_test_exercice(request, test_exercice_pk):
 
     questions = exercice.get_questions()
 
-    for question in questions:
+    for position, question in enumerate(questions):
         with transaction.atomic():
             link = List_question.objects.create(
                 context_id=new_exercice.id,
                 question_id=question.id,
+                position=position,
             )
 
     return HttpResponseRedirect(
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""The Resources of a Skill, Section or CodeR and of the related ones, grouped as displayed"""
+from __future__ import unicode_literals
+
+from skills.equivalence import get_skill_equivalence
+from skills.models import Skill, Section, CodeR
+
+from .models import KhanAcademy, Sesamath
+
+REFERENCES = {
+    "skills_sesamathskill": Sesamath,
+    "skills_khanacademyvideoskill": KhanAcademy,
+}
+"""The models referenced by the Resources, by content["from"]"""
+
+SPLIT_REFERENCES = {
+    "lesson_resource": ("skills_sesamathskill", "skills_khanacademyvideoskill"),
+    "exercice_resource": ("skills_sesamathskill",),
+}
+"""The references displayed apart from the other Resources of a section"""
+
+
+def _links(model, owner_ids):
+    """The (owner, Resource) pairs of some Skills, Sections or CodeR, in a single query"""
+    field = model._meta.model_name
+    links = model.resource.through.objects.filter(**{field + "__in": owner_ids}).select_related(
+        field, "resource__added_by").order_by("resource_id")
+
+    return [(getattr(x, field), x.resource) for x in links]
+
+
+def _split(resources, section, resolved):
+    """Separate the references of a section from its other Resources
+
+    :returns: The other Resources, and the [Resource id, referenced object] of each reference, by content["from"]
+    """
+    kinds = SPLIT_REFERENCES.get(section, ())
+    others, references = [], {kind: [] for kind in kinds}
+
+    for resource in resources:
+        kind = resource.content.get("from")
+        if kind not in kinds:
+            others.append(resource)
+        # the references to a missing row are not displayed
+        elif resource.content.get("referenced") in resolved[kind]:
+            references[kind].append([resource.pk, resolved[kind][resource.content["referenced"]]])
+
+    return others, references
+
+
+def get_resource_listing(base):
+    """
+    Group the Resources of a Skill, Section or CodeR and of the related ones, with a few queries.
+
+    The related ones are the Skills similar or identical to a Skill and its
+    CodeR, or the CodeR similar or identical to a CodeR (see
+    skills.equivalence). The references to Sesamath and KhanAcademy are
+    loaded at once.
+
+    :returns: The context of the update_pedagogical_resources template, by variable
+    :rtype: dict
+    """
+    equivalence = get_skill_equivalence()
+
+    if isinstance(base, Skill):
+        related = {"sori_skills": _links(Skill, equivalence.similar_skills(base.id)),
+                   "sori_coder": _links(CodeR, CodeR.skill.through.objects.filter(skill=base.id).values("coder"))}
+    elif isinstance(base, CodeR):
+        related = {"sori_coder": _links(CodeR, equivalence.similar_coders(base.id))}
+    else:
+        # the related Resources are not displayed for a Section
+        related = {None: _links(Section, [base.id])}
+
+    own = {}
+    groups = {}
+    for prefix, links in related.items():
+        for owner, resource in links:
+            if type(owner) is type(base) and owner.pk == base.pk:
+                own.setdefault(resource.section, []).append(resource)
+            else:
+                groups.setdefault(prefix, {}).setdefault(owner, {}).setdefault(resource.section, []).append(resource)
+
+    referenced = {}
+    for links in related.values():
+        for _, resource in links:
+            if resource.content.get("from") in REFERENCES:
+                referenced.setdefault(resource.content["from"], set()).add(resource.content.get("referenced"))
+    resolved = {kind: REFERENCES[kind].objects.in_bulk(referenced.get(kind, ())) for kind in REFERENCES}
+
+    lesson_resources, lesson_references = _split(own.get("lesson_resource", []), "lesson_resource", resolved)
+    exercice_resources, exercice_references = _split(own.get("exercice_resource", []), "exercice_resource", resolved)
+
+    listing = {
+        "personal_resources": own.get("personal_resource", []),
+        "other_resources": own.get("other_resource", []),
+        "lesson_resources": lesson_resources,
+        "lesson_resource_sesamath": lesson_references["skills_sesamathskill"],
+        "lesson_resource_khanacademy": lesson_references["skills_khanacademyvideoskill"],
+        "exercice_resources": exercice_resources,
+        "exercice_resource_sesamath": exercice_references["skills_sesamathskill"],
+    }
+
+    for prefix in ("sori_skills", "sori_coder"):
+        for name in ("lesson_resources", "exercice_resources", "other_resources", "lesson_resource_sesamath",
+                     "lesson_resource_khanacademy", "exercice_resource_sesamath"):
+            listing["%s_%s" % (prefix, name)] = []
+
+        for owner, sections in sorted(groups.get(prefix, {}).items(), key=lambda x: x[0].pk):
+            lesson, lesson_references = _split(sections.get("lesson_resource", []), "lesson_resource", resolved)
+            exercice, exercice_references = _split(sections.get("exercice_resource", []), "exercice_resource",
+                                                   resolved)
+
+            for name, resources in (
+                    ("lesson_resources", lesson),
+                    ("exercice_resources", exercice),
+                    ("other_resources", sections.get("other_resource")),
+                    ("lesson_resource_sesamath", lesson_references["skills_sesamathskill"]),
+                    ("lesson_resource_khanacademy", lesson_references["skills_khanacademyvideoskill"]),
+                    ("exercice_resource_sesamath", exercice_references["skills_sesamathskill"])):
+                if resources:
+                    listing["%s_%s" % (prefix, name)].append([owner, resources])
+
+    return listing
+
@@ -3,4 +3,81 @@ from __future__ import unicode_literals
 
 from django.test import TestCase
 
-# Create your tests here.
+from skills.models import Skill, CodeR, Relations
+from .listing import get_resource_listing
+from .models import Resource, Sesamath, KhanAcademy
+
+
+class ResourceListingTest(TestCase):
+    def setUp(self):
+        # skill_2 is similar to skill, skill_3 is identical to skill_2 (so similar to skill too)
+        self.skill, self.skill_2, self.skill_3 = [
+            Skill.objects.create(code=code, name=code, description=code) for code in ("S1", "S2", "S3")]
+        Relations.objects.create(from_skill=self.skill_2, to_skill=self.skill, relation_type="similar_to")
+        Relations.objects.create(from_skill=self.skill_3, to_skill=self.skill_2, relation_type="identic_to")
+
+        self.coder = CodeR.objects.create(sub_code="R1", name="R1")
+        self.coder.skill.add(self.skill)
+
+        self.sesamath = Sesamath.objects.create(
+            classe_int=1, classe="1ère", ressource_kind="Manuel", chapitre="1", title="Sesamath",
+            section_kind="Fiche", file_name="sesamath.pdf", on_oscar="http://example.com/sesamath.pdf")
+        self.khanacademy = KhanAcademy.objects.create(
+            subject="Maths", tutorial="Tutorial", youtube_id="abc", title="Khan", slug="khan", duration=60)
+
+        self.resources = {}
+        for name, owner, section, content in (
+                ("personal", self.skill, "personal_resource", {"title": "personal"}),
+                ("lesson", self.skill, "lesson_resource", {"title": "lesson"}),
+                ("lesson_sesamath", self.skill, "lesson_resource",
+                 {"from": "skills_sesamathskill", "referenced": self.sesamath.id}),
+                ("lesson_khanacademy", self.skill, "lesson_resource",
+                 {"from": "skills_khanacademyvideoskill", "referenced": self.khanacademy.id}),
+                ("exercice_sesamath", self.skill, "exercice_resource",
+                 {"from": "skills_sesamathskill", "referenced": self.sesamath.id}),
+                ("missing", self.skill, "exercice_resource",
+                 {"from": "skills_sesamathskill", "referenced": self.sesamath.id + 1}),
+                ("other", self.skill, "other_resource", {"title": "other"}),
+                ("skill_2_lesson", self.skill_2, "lesson_resource", {"title": "lesson 2"}),
+                ("skill_3_exercice_sesamath", self.skill_3, "exercice_resource",
+                 {"from": "skills_sesamathskill", "referenced": self.sesamath.id}),
+                ("coder_other", self.coder, "other_resource", {"title": "other R1"})):
+            self.resources[name] = Resource.objects.create(section=section, content=content)
+            owner.resource.add(self.resources[name])
+
+    def test_skill(self):
+        resources = self.resources
+
+        self.assertEqual(get_resource_listing(self.skill), {
+            # the same grouping as the views before the listing
+            "personal_resources": [resources["personal"]],
+            "other_resources": [resources["other"]],
+            "lesson_resources": [resources["lesson"]],
+            "lesson_resource_sesamath": [[resources["lesson_sesamath"].pk, self.sesamath]],
+            "lesson_resource_khanacademy": [[resources["lesson_khanacademy"].pk, self.khanacademy]],
+            # the reference to a missing Sesamath is left out, the views answered a 404 before
+            "exercice_resources": [],
+            "exercice_resource_sesamath": [[resources["exercice_sesamath"].pk, self.sesamath]],
+            "sori_skills_lesson_resources": [[self.skill_2, [resources["skill_2_lesson"]]]],
+            "sori_skills_exercice_resources": [],
+            "sori_skills_other_resources": [],
+            "sori_skills_lesson_resource_sesamath": [],
+            "sori_skills_lesson_resource_khanacademy": [],
+            # skill_3 is only related through skill_2, the views ignored it before
+            "sori_skills_exercice_resource_sesamath": [
+                [self.skill_3, [[resources["skill_3_exercice_sesamath"].pk, self.sesamath]]]],
+            "sori_coder_lesson_resources": [],
+            "sori_coder_exercice_resources": [],
+            "sori_coder_other_resources": [[self.coder, [resources["coder_other"]]]],
+            "sori_coder_lesson_resource_sesamath": [],
+            "sori_coder_lesson_resource_khanacademy": [],
+            "sori_coder_exercice_resource_sesamath": [],
+        })
+
+    def test_coder(self):
+        listing = get_resource_listing(self.coder)
+
+        self.assertEqual(listing["other_resources"], [self.resources["coder_other"]])
+        self.assertEqual(listing["lesson_resources"], [])
+        self.assertEqual(listing["sori_skills_lesson_resources"], [])
+        self.assertEqual(listing["sori_coder_other_resources"], [])
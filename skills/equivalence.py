@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""In-memory index of the "identic_to" and "similar_to" relations between Skills and between CodeR"""
+from __future__ import unicode_literals
+
+
+class UnionFind(object):
+    """Disjoint sets of hashable elements, with path compression and union by size"""
+
+    def __init__(self):
+        self._parent = {}
+        self._size = {}
+
+    def find(self, element):
+        """The representative of the set of an element"""
+        parent = self._parent.setdefault(element, element)
+        if parent == element:
+            self._size.setdefault(element, 1)
+            return element
+
+        root = self.find(parent)
+        self._parent[element] = root
+        return root
+
+    def union(self, first, second):
+        """Merge the sets of two elements"""
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return
+
+        if self._size[first] < self._size[second]:
+            first, second = second, first
+
+        self._parent[second] = first
+        self._size[first] += self._size.pop(second)
+
+    def classes(self):
+        """Each element with the frozenset of the elements of its set"""
+        members = {}
+        for element in list(self._parent):
+            members.setdefault(self.find(element), []).append(element)
+
+        classes = {}
+        for elements in members.values():
+            elements = frozenset(elements)
+            for element in elements:
+                classes[element] = elements
+
+        return classes
+
+
+def equivalence_classes(pairs):
+    """The equivalence classes of the closure of some pairs, by element"""
+    union_find = UnionFind()
+    for first, second in pairs:
+        union_find.union(first, second)
+
+    return union_find.classes()
+
+
+class SkillEquivalence(object):
+    """
+        The equivalence classes of the Skills and of the CodeR, loaded once.
+
+        The relations are symmetric and transitive: a Skill identic_to
+        another one identic_to a third one is identical to both, whatever the
+        direction of the Relations rows. "Similar" includes "identical".
+        Every lookup is a dictionary read and includes the element itself.
+
+    """
+
+    def __init__(self, skill_relations, coder_relations):
+        """
+        :param skill_relations: iterable of (from_skill_id, to_skill_id, relation_type)
+        :param coder_relations: iterable of (from_coder_id, to_coder_id, relation_type)
+        """
+        skill_relations, coder_relations = list(skill_relations), list(coder_relations)
+
+        self._identic_skills = equivalence_classes((x, y) for x, y, kind in skill_relations if kind == "identic_to")
+        self._similar_skills = equivalence_classes((x, y) for x, y, _ in skill_relations)
+        self._identic_coders = equivalence_classes((x, y) for x, y, kind in coder_relations if kind == "identic_to")
+        self._similar_coders = equivalence_classes((x, y) for x, y, _ in coder_relations)
+
+    @classmethod
+    def load(cls):
+        """Build the index from the Relations and CodeR_relations tables, a query for each"""
+        from .models import Relations, CodeR_relations
+
+        types = ("identic_to", "similar_to")
+
+        return cls(
+            Relations.objects.filter(relation_type__in=types).values_list(
+                "from_skill_id", "to_skill_id", "relation_type"),
+            CodeR_relations.objects.filter(relation_type__in=types).values_list(
+                "from_coder_id", "to_coder_id", "relation_type"),
+        )
+
+    @staticmethod
+    def _class(classes, element):
+        return classes.get(element, frozenset((element,)))
+
+    def identic_skills(self, skill_id):
+        """All the Skills identical to a Skill, itself included"""
+        return self._class(self._identic_skills, skill_id)
+
+    def similar_skills(self, skill_id):
+        """All the Skills similar or identical to a Skill, itself included"""
+        return self._class(self._similar_skills, skill_id)
+
+    def identic_coders(self, coder_id):
+        """All the CodeR identical to a CodeR, itself included"""
+        return self._class(self._identic_coders, coder_id)
+
+    def similar_coders(self, coder_id):
+        """All the CodeR similar or identical to a CodeR, itself included"""
+        return self._class(self._similar_coders, coder_id)
+
+
+_skill_equivalence = None
+"""The process-wide SkillEquivalence, with the RelationsVersion it was loaded at"""
+
+
+def get_skill_equivalence():
+    """Get the process-wide SkillEquivalence, loading it again if the relations changed since (see RelationsVersion)"""
+    from .models import RelationsVersion
+
+    global _skill_equivalence
+
+    # read before loading, the index is at least as recent as its version
+    version = RelationsVersion.current()
+    if _skill_equivalence is None or _skill_equivalence[0] != version:
+        _skill_equivalence = (version, SkillEquivalence.load())
+
+    return _skill_equivalence[1]
+
+
+def invalidate_skill_equivalence():
+    """Drop the process-wide SkillEquivalence, it is reloaded on next use"""
+    global _skill_equivalence
+    _skill_equivalence = None
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""In-memory index of the "depend_on" Relations between Skills"""
+from __future__ import unicode_literals
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SkillGraph(object):
+    """
+        The prerequisite graph of all the Skills, loaded once.
+
+        A Relations row (from_skill, to_skill, "depend_on") means that
+        to_skill is a prerequisite of from_skill. The transitive closure
+        is precomputed in both directions, so that every prerequisite
+        lookup is a dictionary read instead of a recursive SQL walk.
+        Skills are identified by their primary key.
+
+    """
+
+    def __init__(self, edges):
+        """
+        :param edges: iterable of (skill_id, prerequisite_id) pairs
+        """
+        self._prerequisites = {}
+        self._dependents = {}
+
+        for skill_id, prerequisite_id in edges:
+            prerequisites = self._prerequisites.setdefault(skill_id, [])
+            if prerequisite_id not in prerequisites:
+                prerequisites.append(prerequisite_id)
+                self._dependents.setdefault(prerequisite_id, []).append(skill_id)
+
+        self.cycles = self._find_cycles()
+        """The loops found in the skill tree, as lists of Skill ids"""
+
+        if self.cycles:
+            logger.warning("Loops found in the skill tree: %s", self.cycles)
+
+        self._all_prerequisites = self._closure(self._prerequisites)
+        self._all_dependents = self._closure(self._dependents)
+
+    @classmethod
+    def load(cls):
+        """Build the graph from the Relations table in a single query"""
+        from .models import Relations
+
+        return cls(Relations.objects.filter(relation_type="depend_on").values_list("from_skill_id", "to_skill_id"))
+
+    @staticmethod
+    def _walk(adjacency, start):
+        """Depth-first pre-order walk from start (excluded), each node is reached once"""
+        seen = {start}
+        order = []
+        stack = [iter(adjacency.get(start, ()))]
+
+        while stack:
+            for node in stack[-1]:
+                if node not in seen:
+                    seen.add(node)
+                    order.append(node)
+                    stack.append(iter(adjacency.get(node, ())))
+                    break
+            else:
+                stack.pop()
+
+        return tuple(order)
+
+    def _closure(self, adjacency):
+        return {node: self._walk(adjacency, node) for node in adjacency}
+
+    def _find_cycles(self):
+        """Find the back edges of the graph with an iterative depth-first search"""
+        cycles = []
+        # 1: on the current path, 2: done
+        state = {}
+
+        for root in self._prerequisites:
+            if root in state:
+                continue
+
+            path = [root]
+            state[root] = 1
+            stack = [iter(self._prerequisites.get(root, ()))]
+
+            while stack:
+                for node in stack[-1]:
+                    if state.get(node) == 1:
+                        cycles.append(path[path.index(node):] + [node])
+                    elif node not in state:
+                        state[node] = 1
+                        path.append(node)
+                        stack.append(iter(self._prerequisites.get(node, ())))
+                        break
+                else:
+                    stack.pop()
+                    state[path.pop()] = 2
+
+        return cycles
+
+    def prerequisites(self, skill_id):
+        """The direct prerequisites of a Skill"""
+        return tuple(self._prerequisites.get(skill_id, ()))
+
+    def dependents(self, skill_id):
+        """The Skills that directly depend on a Skill"""
+        return tuple(self._dependents.get(skill_id, ()))
+
+    def all_prerequisites(self, skill_id):
+        """All the prerequisites of a Skill, recursively, in depth-first order"""
+        return self._all_prerequisites.get(skill_id, ())
+
+    def all_dependents(self, skill_id):
+        """All the Skills depending on a Skill, recursively, in depth-first order"""
+        return self._all_dependents.get(skill_id, ())
+
+    def recommended(self, not_acquired):
+        """
+        The Skills to recommend among the tested and not acquired Skills of a
+        Student: the ones without a prerequisite also tested and not acquired.
+
+        :param not_acquired: the ids of the tested and not acquired Skills
+        :rtype: set
+        """
+        not_acquired = set(not_acquired)
+        return {x for x in not_acquired if not not_acquired.intersection(self._prerequisites.get(x, ()))}
+
+    def walk_prerequisites(self, skill_ids, follow=None):
+        """
+        Collect the prerequisites of several Skills, recursively.
+
+        :param skill_ids: the Skill ids to start from
+        :param follow: optional predicate, the prerequisites of a Skill are
+            only collected if follow(skill_id) is True
+        :return: the prerequisites ids, without duplicates, in depth-first order
+        :rtype: list
+        """
+        collected = []
+        seen = set()
+
+        def children(skill_id):
+            if follow is not None and not follow(skill_id):
+                return iter(())
+            return iter(self._prerequisites.get(skill_id, ()))
+
+        for skill_id in skill_ids:
+            stack = [children(skill_id)]
+
+            while stack:
+                for node in stack[-1]:
+                    if node not in seen:
+                        seen.add(node)
+                        collected.append(node)
+                        stack.append(children(node))
+                        break
+                else:
+                    stack.pop()
+
+        return collected
+
+
+_skill_graph = None
+"""The process-wide SkillGraph, with the RelationsVersion it was loaded at"""
+
+
+def get_skill_graph():
+    """Get the process-wide SkillGraph, loading it again if the Relations changed since (see RelationsVersion)"""
+    from .models import RelationsVersion
+
+    global _skill_graph
+
+    # read before loading, the graph is at least as recent as its version
+    version = RelationsVersion.current()
+    if _skill_graph is None or _skill_graph[0] != version:
+        _skill_graph = (version, SkillGraph.load())
+
+    return _skill_graph[1]
+
+
+def invalidate_skill_graph():
+    """Drop the process-wide SkillGraph, it is reloaded on next use"""
+    global _skill_graph
+    _skill_graph = None
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from skills.graph import get_skill_graph
+from skills.models import StudentSkill
+from users.models import Student
+
+
+def depth_function(adjacency):
+    """Get a function returning the length of the longest chain starting from a Skill (loops are cut)"""
+    depths = {}
+
+    def depth(skill_id, path):
+        if skill_id in depths:
+            return depths[skill_id]
+
+        path.add(skill_id)
+        result = 0
+        for node in adjacency(skill_id):
+            if node not in path:
+                result = max(result, 1 + depth(node, path))
+        path.discard(skill_id)
+
+        depths[skill_id] = result
+        return result
+
+    return depth
+
+
+class Command(BaseCommand):
+
+    help = "Measure the cost of the skill propagation (validate/unvalidate) against the depth in the skill tree"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--student", dest="student", type=int, help="The Student id to run the propagation on")
+        parser.add_argument("--samples", dest="samples", default=3, type=int, help="The number of Skills per depth")
+
+    def handle(self, *args, **options):
+        if options.get("student"):
+            student = Student.objects.filter(pk=options["student"]).first()
+        else:
+            student = Student.objects.filter(studentskill__isnull=False).first()
+
+        who = User.objects.order_by("-is_superuser", "id").first()
+
+        if student is None or who is None:
+            raise CommandError("A Student with StudentSkills and a User are needed to run the benchmark")
+
+        # loaded once, outside of the measures
+        graph = get_skill_graph()
+        skills = set(StudentSkill.objects.filter(student=student).values_list("skill_id", flat=True))
+
+        self.stdout.write("Student: %s - %s skills - %s loops in the skill tree" % (
+            student, len(skills), len(graph.cycles)))
+
+        for method, adjacency, closure in (
+                ("validate", graph.prerequisites, graph.all_prerequisites),
+                ("unvalidate", graph.dependents, graph.all_dependents)):
+            depth = depth_function(adjacency)
+
+            by_depth = {}
+            for skill_id in sorted(skills):
+                by_depth.setdefault(depth(skill_id, set()), []).append(skill_id)
+
+            self.stdout.write("")
+            self.stdout.write("%s: depth | skills | reached | queries | ms" % method)
+
+            for level in sorted(by_depth):
+                sample = by_depth[level][:options["samples"]]
+
+                reached, queries, duration = 0, 0, 0
+                for skill_id in sample:
+                    student_skill = StudentSkill.objects.get(student=student, skill_id=skill_id)
+
+                    with transaction.atomic():
+                        with CaptureQueriesContext(connection) as context:
+                            start = time.time()
+                            getattr(student_skill, method)(who=who, reason="Benchmark", reason_object=student)
+                            duration += time.time() - start
+
+                        transaction.set_rollback(True)
+
+                    reached += 1 + len([x for x in closure(skill_id) if x in skills])
+                    queries += len(context.captured_queries)
+
+                self.stdout.write("%s: %5d | %6d | %7.1f | %7.1f | %.1f" % (
+                    method,
+                    level,
+                    len(by_depth[level]),
+                    float(reached) / len(sample),
+                    float(queries) / len(sample),
+                    duration * 1000 / len(sample),
+                ))
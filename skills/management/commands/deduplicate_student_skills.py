@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from skills.models import StudentSkill
+
+
+class Command(BaseCommand):
+
+    help = "Delete the duplicated StudentSkills of a Student for a Skill, keeping the last one tested, " \
+           "before adding their unique constraint"
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM "{table}" WHERE "id" IN ('
+                'SELECT "id" FROM ('
+                'SELECT "id", ROW_NUMBER() OVER (PARTITION BY "student_id", "skill_id" '
+                'ORDER BY GREATEST("acquired", "tested") DESC NULLS LAST, "id" DESC) AS "rank" '
+                'FROM "{table}") AS "ranks" '
+                'WHERE "ranks"."rank" > 1)'.format(table=StudentSkill._meta.db_table)
+            )
+            deleted = cursor.rowcount
+
+        self.stdout.write("%s duplicated StudentSkills deleted, run rebuild_lesson_skill_stats to count them again"
+                          % deleted)
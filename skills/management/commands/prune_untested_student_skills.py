@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from skills.models import StudentSkill
+
+
+class Command(BaseCommand):
+
+    help = "Delete the StudentSkills never tested: a missing StudentSkill is not tested"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", dest="chunk_size", default=10000, type=int,
+                            help="The number of StudentSkills deleted together")
+
+    def handle(self, *args, **options):
+        untested = StudentSkill.objects.filter(acquired__isnull=True, tested__isnull=True)
+
+        deleted = 0
+        while True:
+            ids = list(untested.values_list("id", flat=True)[:options["chunk_size"]])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                StudentSkill.objects.filter(id__in=ids).delete()
+
+            deleted += len(ids)
+            self.stdout.write("%s StudentSkills deleted" % deleted)
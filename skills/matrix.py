@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""The states of the Skills of a group of Students, loaded at once"""
+from __future__ import unicode_literals
+
+import numpy
+
+from .models import StudentSkill
+
+UNKNOWN = 0
+NOT_ACQUIRED = 1
+ACQUIRED = 2
+
+STATUSES = ("unknown", "not acquired", "acquired")
+"""The StudentSkill status (see StudentSkill.status) of each state code"""
+
+
+class StudentSkillMatrix(object):
+    """
+        The states of (Student, Skill) pairs in an array of small integers,
+        a row by Student and a column by Skill: UNKNOWN, NOT_ACQUIRED or
+        ACQUIRED. A missing StudentSkill is UNKNOWN.
+
+        Used by the computations over a whole Lesson (see
+        promotions.analytics). The pages of a single Student need the
+        StudentSkills themselves (see get_students_skills), and the Lesson
+        heatmap reads the counters of LessonSkillStats.
+
+    """
+
+    def __init__(self, student_ids, skill_ids, states=None):
+        self.student_ids = list(student_ids)
+        self.skill_ids = list(skill_ids)
+
+        self.student_index = {x: number for number, x in enumerate(self.student_ids)}
+        self.skill_index = {x: number for number, x in enumerate(self.skill_ids)}
+
+        if states is None:
+            states = numpy.zeros((len(self.student_ids), len(self.skill_ids)), dtype=numpy.int8)
+        self.states = states
+
+    @classmethod
+    def load(cls, student_ids, skill_ids):
+        """Load the states of some Students for some Skills, in a single query"""
+        matrix = cls(student_ids, skill_ids)
+
+        if not matrix.student_ids or not matrix.skill_ids:
+            return matrix
+
+        rows = StudentSkill.objects.filter(student__in=matrix.student_ids, skill__in=matrix.skill_ids).values_list(
+            "student_id", "skill_id", "acquired", "tested")
+
+        for student_id, skill_id, acquired, tested in rows:
+            if acquired:
+                state = ACQUIRED
+            elif tested:
+                state = NOT_ACQUIRED
+            else:
+                continue
+
+            matrix.states[matrix.student_index[student_id], matrix.skill_index[skill_id]] = state
+
+        return matrix
+
+    @classmethod
+    def for_lesson(cls, lesson, skill_ids=None):
+        """Load the states of the Students of a Lesson, for the Skills of its Stages by default"""
+        from promotions.models import Stage
+
+        if skill_ids is None:
+            skill_ids = Stage.skills.through.objects.filter(
+                stage__in=lesson.stages_in_unchronological_order()).values_list("skill_id", flat=True).distinct()
+
+        return cls.load(lesson.students.values_list("id", flat=True), skill_ids)
+
+    def state(self, student_id, skill_id):
+        """The state code of a Student for a Skill, UNKNOWN if not loaded"""
+        if student_id not in self.student_index or skill_id not in self.skill_index:
+            return UNKNOWN
+
+        return int(self.states[self.student_index[student_id], self.skill_index[skill_id]])
+
+    def status(self, student_id, skill_id):
+        """The status of a Student for a Skill: "acquired", "not acquired" or "unknown" """
+        return STATUSES[self.state(student_id, skill_id)]
+
+    def count(self, state, axis=0):
+        """Count a state by Skill (axis=0) or by Student (axis=1)"""
+        return (self.states == state).sum(axis=axis)
+
+    def acquisition_rate(self):
+        """The part of the tested Students having acquired each Skill, NaN when nobody is tested"""
+        acquired = self.count(ACQUIRED).astype(float)
+        tested = acquired + self.count(NOT_ACQUIRED)
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return acquired / tested
+
+    def coverage(self):
+        """The part of the Skills tested for each Student"""
+        if not self.skill_ids:
+            return numpy.zeros(len(self.student_ids))
+
+        return (self.states != UNKNOWN).sum(axis=1) / float(len(self.skill_ids))
+
+    def acquisition_rate_by_skill(self):
+        """The acquisition rate of each Skill tested at least once, by Skill id"""
+        return {
+            skill_id: float(rate)
+            for skill_id, rate in zip(self.skill_ids, self.acquisition_rate())
+            if not numpy.isnan(rate)
+        }
+
+    def coverage_by_student(self):
+        """The coverage of each Student, by Student id"""
+        return {student_id: float(rate) for student_id, rate in zip(self.student_ids, self.coverage())}
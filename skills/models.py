@@ -2,12 +2,19 @@
 from __future__ import unicode_literals
 
 from django.db import models
+from django.db.models import F
 from datetime import datetime
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from examinations.models import Context
 
+from .equivalence import invalidate_skill_equivalence
+from .graph import invalidate_skill_graph
+from .signals import student_skills_changed
+
 class Skill(models.Model):
     """[FR] Compétence
 
@@ -97,6 +104,36 @@ class Relations(models.Model):
         verbose_name = 'Relations between Skill'
         verbose_name_plural = 'Relations between Skill\'s'
 
+class RelationsVersion(models.Model):
+    """
+        The version of the Relations and CodeR_relations, a single row
+        increased each time one of them changes.
+
+        Compared by each process with the version its in-memory indexes were
+        loaded at (see skills.graph and skills.equivalence), to load them
+        again after a change made by another process.
+
+    """
+
+    version = models.PositiveIntegerField(default=0)
+
+    @staticmethod
+    def current():
+        """The version of the relations, 0 until they change"""
+        return RelationsVersion.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+
+    @staticmethod
+    def increase():
+        """Record a change of the relations"""
+        if RelationsVersion.objects.filter(pk=1).update(version=F("version") + 1):
+            return
+
+        _, created = RelationsVersion.objects.get_or_create(pk=1, defaults={"version": 1})
+        if not created:
+            # created meanwhile by another change
+            RelationsVersion.objects.filter(pk=1).update(version=F("version") + 1)
+
+
 class Section(models.Model):
     """[FR] Rubrique
 
@@ -228,91 +265,103 @@ class StudentSkill(models.Model):
     """When the Skill was acquired"""
     # bad: doesn't support regression
 
+    class Meta:
+        unique_together = ("student", "skill")
+
     def __unicode__(self):
         return u"%s - %s - %s" % (self.student, self.skill, "green" if self.acquired else ("orange" if self.tested else "white"))
 
-    def go_down_visitor(self, function):
-        """Help function to explore and validate prerequisites when a Skill is validated"""
-        # protective code against loops in skill tree
-        already_done = set()
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(StudentSkill, cls).from_db(db, field_names, values)
+        # remember the status loaded, to know the transition when saved
+        if not {"acquired", "tested"} & instance.get_deferred_fields():
+            instance._loaded_status = instance.get_status()
+        return instance
+
+    @staticmethod
+    def get_or_untested(student, skill):
+        """Get the StudentSkill of a Student for a Skill
 
-        def traverse(student_skill):
-            function(student_skill)
+        The StudentSkills are only created when tested (see SkillPropagation):
+        if it does not exist yet, an unsaved not tested StudentSkill is returned.
+        """
+        student_skill = StudentSkill.objects.filter(student=student, skill=skill).first()
 
-            for sub_student_skill in StudentSkill.objects.filter(skill__in=student_skill.skill.get_prerequisites_skills(), student=self.student):
-                if sub_student_skill.id not in already_done:
-                    already_done.add(sub_student_skill.id)
-                    traverse(sub_student_skill)
+        if student_skill is None:
+            student_skill = StudentSkill(student=student, skill=skill)
 
-        traverse(self)
+        return student_skill
 
-    # TODO: Does not work, need to create a reverse to the Manytomany relation
-    def go_up_visitor(self, function):
-        """
-        Help function to explore and invalidate (parent) Skill that depends on the failed Skill.
-        A failed prerequisite implies that the Skills that depends on it must be failed too.
+    @staticmethod
+    def for_skills(student, skills, existing=None):
+        """Get the StudentSkills of a Student for several Skills, in the same order
+
+        The missing StudentSkills are unsaved and not tested, see get_or_untested
+
+        :param existing: the StudentSkills of the Student by Skill id, if already loaded
         """
-        # protective code against loops in skill tree
-        already_done = set()
+        skills = list(skills)
+        if existing is None:
+            existing = {x.skill_id: x for x in StudentSkill.objects.filter(student=student, skill__in=skills)}
+
+        student_skills = []
+        for skill in skills:
+            student_skill = existing.get(skill.id)
+
+            if student_skill is None:
+                student_skill = StudentSkill(student=student, skill=skill)
+            else:
+                # shared, for the recommended Skills of the Student to be computed once
+                student_skill.student = student
+                student_skill.skill = skill
 
-        def traverse(student_skill):
-            function(student_skill)
+            student_skills.append(student_skill)
 
-            for sub_student_skill in StudentSkill.objects.filter(skill__in=student_skill.skill.get_prerequisites_skills(), student=self.student):
-                if sub_student_skill.id not in already_done:
-                    already_done.add(sub_student_skill.id)
-                    traverse(sub_student_skill)
+        return student_skills
 
-        traverse(self)
+    @staticmethod
+    def status(acquired, tested):
+        """The status of a StudentSkill: "acquired", "not acquired" or "unknown" (not tested)"""
+        if acquired:
+            return "acquired"
+        elif tested:
+            return "not acquired"
+        return "unknown"
+
+    def get_status(self):
+        return StudentSkill.status(self.acquired, self.tested)
 
     def validate(self, who, reason, reason_object):
-        """Validates a Skill (change its status to "acquired")"""
-        def validate_student_skill(student_skill):
-            SkillHistory.objects.create(
-                skill=self.skill,
-                student=self.student,
-                value="acquired",
-                by_who=who,
-                reason=reason if student_skill == self else "Déterminé depuis une réponse précédente.",
-                reason_object=reason_object,
-            )
-
-            student_skill.acquired = datetime.now()
-            student_skill.save()
-
-        self.go_down_visitor(validate_student_skill)
+        """Validates a Skill (change its status to "acquired") and all its prerequisites"""
+        from .propagation import SkillPropagation
+
+        propagation = SkillPropagation(who)
+        propagation.validate(self.student_id, self.skill_id, reason, reason_object)
+        propagation.save()
+
+        self.acquired = propagation.now
+        self._saved_by(propagation)
 
     def unvalidate(self, who, reason, reason_object):
-        """Invalidates a Skill (change its status to "not acquired")"""
-        def unvalidate_student_skill(student_skill):
-            SkillHistory.objects.create(
-                skill=self.skill,
-                student=self.student,
-                value="not acquired",
-                by_who=who,
-                reason=reason if student_skill == self else "Déterminé depuis une réponse précédente.",
-                reason_object=reason_object,
-            )
-
-            student_skill.acquired = None
-            student_skill.tested = datetime.now()
-            student_skill.save()
-
-        # Up traversal does not work, disabled
-        # self.go_up_visitor(unvalidate_student_skill)
-
-        # TODO: erase the following lines when go_up_visitor is repaired
-        SkillHistory.objects.create(
-            skill=self.skill,
-            student=self.student,
-            value="not acquired",
-            by_who=who,
-            reason=reason,
-            reason_object=reason_object,
-        )
+        """Invalidates a Skill (change its status to "not acquired") and all the Skills depending on it"""
+        from .propagation import SkillPropagation
+
+        propagation = SkillPropagation(who)
+        propagation.unvalidate(self.student_id, self.skill_id, reason, reason_object)
+        propagation.save()
+
         self.acquired = None
-        self.tested = datetime.now()
-        self.save()
+        self.tested = propagation.now
+        self._saved_by(propagation)
+
+    def _saved_by(self, propagation):
+        """Synchronize with the StudentSkill written by a SkillPropagation, it may have created it"""
+        if self.pk is None:
+            self.pk = propagation.get_student_skills(self.student_id).get(self.skill_id)
+            self._state.adding = self.pk is None
+
+        self._loaded_status = self.get_status()
 
     def default(self, who, reason, reason_object):
         """"Reset" a Skill (change its status to "unknown")"""
@@ -327,7 +376,10 @@ class StudentSkill(models.Model):
 
         self.acquired = None
         self.tested = None
-        self.save()
+
+        # a missing StudentSkill is already not tested
+        if self.pk is not None:
+            self.save()
 
     def recommended_to_learn(self):
         """
@@ -338,9 +390,40 @@ class StudentSkill(models.Model):
         if self.acquired or not self.tested:
             return False
 
-        for skill in self.skill.get_prerequisites_skills():
-            skill = StudentSkill.objects.get(student=self.student, skill=skill)
-            if not skill.acquired and skill.tested:
-                return False
+        return self.skill_id in self.student.get_recommended_skill_ids()
+
+
+@receiver(post_save, sender=Relations)
+@receiver(post_delete, sender=Relations)
+def invalidate_skill_graph_on_relations_change(sender, **kwargs):
+    RelationsVersion.increase()
+    invalidate_skill_graph()
+    invalidate_skill_equivalence()
+
+
+@receiver(post_save, sender=CodeR_relations)
+@receiver(post_delete, sender=CodeR_relations)
+def invalidate_skill_equivalence_on_coder_relations_change(sender, **kwargs):
+    RelationsVersion.increase()
+    invalidate_skill_equivalence()
+
+
+@receiver(post_save, sender=StudentSkill)
+def send_student_skill_transition(sender, instance, created, **kwargs):
+    # a missing StudentSkill is not tested
+    before = "unknown" if created else getattr(instance, "_loaded_status", "unknown")
+    after = instance.get_status()
+    instance._loaded_status = after
+
+    if before != after:
+        student_skills_changed.send(sender=StudentSkill, transitions=[
+            (instance.student_id, instance.skill_id, before, after)])
+
+
+@receiver(post_delete, sender=StudentSkill)
+def send_student_skill_deletion(sender, instance, **kwargs):
+    before = getattr(instance, "_loaded_status", instance.get_status())
 
-        return True
+    if before != "unknown":
+        student_skills_changed.send(sender=StudentSkill, transitions=[
+            (instance.student_id, instance.skill_id, before, "unknown")])
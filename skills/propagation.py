@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""Set-based propagation of the StudentSkill states along the skill tree"""
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db import transaction
+
+from promotions.models import Lesson, Stage
+from users.models import Student
+
+from .graph import get_skill_graph
+from .models import StudentSkill, SkillHistory
+from .signals import skill_histories_created, student_skills_changed
+
+DEDUCED_REASON = "Déterminé depuis une réponse précédente."
+"""The reason stored for the Skills whose status is deduced from another Skill"""
+
+
+class SkillPropagation(object):
+    """
+        Collects the status changes of StudentSkills and writes them
+        all at once with save(): at most one UPDATE per status and one
+        INSERT for the new StudentSkills and the SkillHistory rows,
+        whatever the size of the tree.
+
+        The status changes are applied in the order they are made, so a
+        later change of a StudentSkill overrides an earlier one.
+
+    """
+
+    def __init__(self, who, graph=None):
+        """
+        :param who: the User responsible for the changes
+        :param graph: the SkillGraph to use, the process-wide one by default
+        """
+        self.who = who
+        self.graph = graph if graph is not None else get_skill_graph()
+        self.now = datetime.now()
+
+        self._student_skills = {}
+        self._curricula = {}
+        self._previous_stages = None
+        self._values = OrderedDict()
+        self._histories = []
+
+    def prefetch(self, student_ids):
+        """Load the StudentSkills of several Students in a single query"""
+        student_ids = [x for x in set(student_ids) if x not in self._student_skills]
+
+        if not student_ids:
+            return
+
+        for student_id in student_ids:
+            self._student_skills[student_id] = {}
+
+        for pk, student_id, skill_id in StudentSkill.objects.filter(student__in=student_ids).values_list(
+                "id", "student_id", "skill_id"):
+            self._student_skills[student_id][skill_id] = pk
+
+    def get_student_skills(self, student_id):
+        """Get the StudentSkill ids of a Student, by Skill id"""
+        self.prefetch([student_id])
+        return self._student_skills[student_id]
+
+    def prefetch_curricula(self, student_ids):
+        """Load the curricula of several Students at once, see get_curriculum"""
+        student_ids = [x for x in set(student_ids) if x not in self._curricula]
+
+        if not student_ids:
+            return
+
+        if self._previous_stages is None:
+            self._previous_stages = dict(Stage.objects.values_list("id", "previous_stage_id"))
+
+        student_stages = {x: set() for x in student_ids}
+        for student_id, stage_id in Lesson.students.through.objects.filter(student__in=student_ids).values_list(
+                "student_id", "lesson__stage_id"):
+            stage_ids = student_stages[student_id]
+            while stage_id is not None and stage_id not in stage_ids:
+                stage_ids.add(stage_id)
+                stage_id = self._previous_stages.get(stage_id)
+
+        stage_skills = {}
+        all_stage_ids = set().union(*student_stages.values())
+        if all_stage_ids:
+            for stage_id, skill_id in Stage.skills.through.objects.filter(stage__in=all_stage_ids).values_list(
+                    "stage_id", "skill_id"):
+                stage_skills.setdefault(stage_id, set()).add(skill_id)
+
+        for student_id, stage_ids in student_stages.items():
+            self._curricula[student_id] = set().union(*[stage_skills.get(x, ()) for x in stage_ids])
+
+    def get_curriculum(self, student_id):
+        """Get the Skill ids of the Stages (and their previous Stages) of the Lessons of a Student"""
+        self.prefetch_curricula([student_id])
+        return self._curricula[student_id]
+
+    def set_value(self, student_id, skill_ids, value, reason, reason_object):
+        """
+        Change the status of several Skills of a Student.
+
+        :param skill_ids: the Skill ids, the first one is the Skill the reason is about,
+            the following ones are deduced from it
+        :param value: the new status: "acquired", "not acquired" or "unknown"
+        """
+        student_skills = self.get_student_skills(student_id)
+
+        for number, skill_id in enumerate(skill_ids):
+            if skill_id in student_skills:
+                key = student_skills[skill_id]
+            # a missing StudentSkill is not tested yet, it is created for the Skill tested
+            # and for the Skills deduced from it in the curriculum of the Student
+            elif number == 0 or skill_id in self.get_curriculum(student_id):
+                key = (student_id, skill_id)
+            else:
+                continue
+
+            # keep the order of the changes, the last one wins
+            self._values.pop(key, None)
+            self._values[key] = value
+
+            self._histories.append(SkillHistory(
+                skill_id=skill_id,
+                student_id=student_id,
+                value=value,
+                by_who=self.who,
+                reason=reason if number == 0 else DEDUCED_REASON,
+                reason_object=reason_object,
+            ))
+
+    def validate(self, student_id, skill_id, reason, reason_object):
+        """Validates a Skill and all its prerequisites"""
+        self.set_value(student_id, (skill_id,) + self.graph.all_prerequisites(skill_id),
+                       "acquired", reason, reason_object)
+
+    def unvalidate(self, student_id, skill_id, reason, reason_object):
+        """Invalidates a Skill and all the Skills depending on it"""
+        self.set_value(student_id, (skill_id,) + self.graph.all_dependents(skill_id),
+                       "not acquired", reason, reason_object)
+
+    def save(self):
+        """Writes all the collected changes"""
+        missing = [key for key in self._values if isinstance(key, tuple)]
+
+        with transaction.atomic():
+            if missing:
+                # the Students are locked for their StudentSkills to be created once (see
+                # StudentSkill.Meta.unique_together), by the first propagation committed
+                list(Student.objects.select_for_update().filter(
+                    pk__in={x[0] for x in missing}).order_by("pk").values_list("pk", flat=True))
+
+                # the StudentSkills created since the prefetch are updated instead
+                for pk, student_id, skill_id in StudentSkill.objects.filter(
+                        student__in={x[0] for x in missing}, skill__in={x[1] for x in missing}).values_list(
+                        "id", "student_id", "skill_id"):
+                    if (student_id, skill_id) in self._values:
+                        self._values[pk] = self._values.pop((student_id, skill_id))
+                        self._student_skills[student_id][skill_id] = pk
+
+            by_value = {}
+            to_create = []
+            transitions = []
+            for key, value in self._values.items():
+                if not isinstance(key, tuple):
+                    by_value.setdefault(value, []).append(key)
+                elif value != "unknown":
+                    to_create.append(StudentSkill(
+                        student_id=key[0],
+                        skill_id=key[1],
+                        acquired=self.now if value == "acquired" else None,
+                        tested=self.now if value == "not acquired" else None,
+                    ))
+                    transitions.append((key[0], key[1], "unknown", value))
+
+            # the StudentSkills are locked to report their exact status transitions
+            for pk, student_id, skill_id, acquired, tested in StudentSkill.objects.select_for_update().filter(
+                    id__in=[pk for pks in by_value.values() for pk in pks]).values_list(
+                    "id", "student_id", "skill_id", "acquired", "tested"):
+                before = StudentSkill.status(acquired, tested)
+                if before != self._values[pk]:
+                    transitions.append((student_id, skill_id, before, self._values[pk]))
+
+            if by_value.get("acquired"):
+                StudentSkill.objects.filter(id__in=by_value["acquired"]).update(acquired=self.now)
+            if by_value.get("not acquired"):
+                StudentSkill.objects.filter(id__in=by_value["not acquired"]).update(acquired=None, tested=self.now)
+            if by_value.get("unknown"):
+                StudentSkill.objects.filter(id__in=by_value["unknown"]).update(acquired=None, tested=None)
+
+            for student_skill in StudentSkill.objects.bulk_create(to_create):
+                self._student_skills[student_skill.student_id][student_skill.skill_id] = student_skill.pk
+
+            histories = SkillHistory.objects.bulk_create(self._histories)
+            if histories:
+                skill_histories_created.send(sender=SkillHistory, histories=histories)
+            if transitions:
+                student_skills_changed.send(sender=StudentSkill, transitions=transitions)
+
+        self._values = OrderedDict()
+        self._histories = []
@@ -0,0 +1,10 @@
+# explain : https://docs.djangoproject.com/en/1.11/topics/signals/#defining-signals
+
+import django.dispatch
+
+# Send a signal when SkillHistory rows are created with bulk_create ; post_save is not sent in that case
+skill_histories_created = django.dispatch.Signal(providing_args=["histories"])
+
+# Send a signal when the status of StudentSkills changes, including with queryset updates ; the transitions are
+# (student_id, skill_id, status before, status after), a missing StudentSkill has the status "unknown"
+student_skills_changed = django.dispatch.Signal(providing_args=["transitions"])
@@ -1,6 +1,192 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
 
-# Create your tests here.
+import numpy
+
+from .equivalence import SkillEquivalence, get_skill_equivalence
+from .graph import SkillGraph, get_skill_graph
+from .matrix import StudentSkillMatrix, ACQUIRED, NOT_ACQUIRED
+from .models import Skill, SkillHistory, StudentSkill, Relations, RelationsVersion
+from .propagation import SkillPropagation, DEDUCED_REASON
+from .signals import student_skills_changed
+from promotions.models import Lesson, Stage
+from users.models import Student
+
+
+class SkillGraphTest(SimpleTestCase):
+    def setUp(self):
+        # 1 depends on 2 and 3, 2 depends on 4, 3 depends on 4
+        self.graph = SkillGraph([(1, 2), (1, 3), (2, 4), (3, 4)])
+
+    def test_direct_relations(self):
+        self.assertEqual(self.graph.prerequisites(1), (2, 3))
+        self.assertEqual(self.graph.dependents(4), (2, 3))
+        self.assertEqual(self.graph.prerequisites(4), ())
+
+    def test_closure(self):
+        self.assertEqual(set(self.graph.all_prerequisites(1)), {2, 3, 4})
+        self.assertEqual(set(self.graph.all_dependents(4)), {1, 2, 3})
+        self.assertEqual(self.graph.all_prerequisites(42), ())
+
+    def test_walk_prerequisites(self):
+        self.assertEqual(self.graph.walk_prerequisites([1]), [2, 4, 3])
+        self.assertEqual(self.graph.walk_prerequisites([1], follow=lambda x: x != 2), [2, 3, 4])
+
+    def test_recommended(self):
+        self.assertEqual(self.graph.recommended([1, 2, 3]), {2, 3})
+        self.assertEqual(self.graph.recommended([1, 4]), {1, 4})
+        self.assertEqual(self.graph.recommended([]), set())
+
+    def test_cycles(self):
+        self.assertEqual(self.graph.cycles, [])
+
+        graph = SkillGraph([(1, 2), (2, 3), (3, 1)])
+        self.assertEqual(graph.cycles, [[1, 2, 3, 1]])
+        self.assertEqual(set(graph.all_prerequisites(1)), {2, 3})
+
+
+class StudentSkillMatrixTest(SimpleTestCase):
+    def setUp(self):
+        # 3 Students, 2 Skills: the first Skill tested by everybody, the second by the first Student only
+        self.matrix = StudentSkillMatrix([10, 11, 12], [1, 2], numpy.array([
+            [ACQUIRED, NOT_ACQUIRED],
+            [ACQUIRED, 0],
+            [NOT_ACQUIRED, 0],
+        ], dtype=numpy.int8))
+
+    def test_status(self):
+        self.assertEqual(self.matrix.status(10, 2), "not acquired")
+        self.assertEqual(self.matrix.status(11, 2), "unknown")
+        self.assertEqual(self.matrix.status(42, 1), "unknown")
+
+    def test_aggregations(self):
+        self.assertEqual(self.matrix.acquisition_rate_by_skill(), {1: 2 / 3.0, 2: 0.0})
+        self.assertEqual(self.matrix.coverage_by_student(), {10: 1.0, 11: 0.5, 12: 0.5})
+
+
+class SkillEquivalenceTest(SimpleTestCase):
+    def setUp(self):
+        # 1 = 2 = 3 whatever the direction of the rows, 3 ~ 4, and the CodeR 10 ~ 11
+        self.equivalence = SkillEquivalence(
+            [(1, 2, "identic_to"), (3, 2, "identic_to"), (3, 4, "similar_to")],
+            [(10, 11, "similar_to")],
+        )
+
+    def test_identic(self):
+        self.assertEqual(self.equivalence.identic_skills(3), {1, 2, 3})
+        self.assertEqual(self.equivalence.identic_skills(4), {4})
+        self.assertEqual(self.equivalence.identic_skills(42), {42})
+
+    def test_similar(self):
+        self.assertEqual(self.equivalence.similar_skills(1), {1, 2, 3, 4})
+        self.assertEqual(self.equivalence.similar_coders(11), {10, 11})
+        self.assertEqual(self.equivalence.identic_coders(11), {11})
+
+
+class SkillPropagationTest(TestCase):
+    def setUp(self):
+        # a depends on b, b depends on c, a depends on d ; d is not in the curriculum of the Student
+        self.a, self.b, self.c, self.d = [
+            Skill.objects.create(code=code, name=code, description=code) for code in ("a", "b", "c", "d")]
+        self.graph = SkillGraph([(self.a.id, self.b.id), (self.b.id, self.c.id), (self.a.id, self.d.id)])
+
+        stage = Stage.objects.create(name="Stage", level=1)
+        stage.skills.add(self.a, self.b, self.c)
+
+        self.who = User.objects.create(username="professor")
+        self.student = Student.objects.create(user=User.objects.create(username="student"))
+        self.lesson = Lesson.objects.create(name="Lesson", stage=stage)
+        self.lesson.students.add(self.student)
+
+        self.transitions = []
+        student_skills_changed.connect(self.record_transitions)
+
+    def tearDown(self):
+        student_skills_changed.disconnect(self.record_transitions)
+
+    def record_transitions(self, sender, transitions, **kwargs):
+        self.transitions.extend(transitions)
+
+    def propagate(self, method, skill):
+        propagation = SkillPropagation(self.who, graph=self.graph)
+        getattr(propagation, method)(self.student.id, skill.id, "Test", self.lesson)
+        propagation.save()
+
+    def statuses(self):
+        return {x.skill.code: x.get_status() for x in StudentSkill.objects.filter(student=self.student)}
+
+    def test_validate_prerequisites(self):
+        self.propagate("validate", self.a)
+
+        # d is not created, outside of the curriculum and not tested
+        self.assertEqual(self.statuses(), {"a": "acquired", "b": "acquired", "c": "acquired"})
+
+    def test_unvalidate_dependents(self):
+        self.propagate("unvalidate", self.c)
+
+        self.assertEqual(self.statuses(), {"a": "not acquired", "b": "not acquired", "c": "not acquired"})
+
+    def test_outside_curriculum(self):
+        # the tested Skill is created even outside of the curriculum
+        self.propagate("unvalidate", self.d)
+        self.assertEqual(self.statuses(), {"a": "not acquired", "d": "not acquired"})
+
+        # and an existing StudentSkill is updated
+        self.propagate("validate", self.a)
+        self.assertEqual(self.statuses(), {"a": "acquired", "b": "acquired", "c": "acquired", "d": "acquired"})
+
+    def test_created_once(self):
+        self.propagate("validate", self.a)
+        self.propagate("validate", self.a)
+
+        self.assertEqual(StudentSkill.objects.filter(student=self.student).count(), 3)
+
+        # the second propagation changes nothing, it is only recorded in the SkillHistory
+        self.assertEqual(sorted(self.transitions), sorted(
+            (self.student.id, x.id, "unknown", "acquired") for x in (self.a, self.b, self.c)))
+
+        histories = SkillHistory.objects.filter(student=self.student).order_by("id")
+        self.assertEqual([(x.skill_id, x.value, x.reason) for x in histories[:3]], [
+            (self.a.id, "acquired", "Test"),
+            (self.b.id, "acquired", DEDUCED_REASON),
+            (self.c.id, "acquired", DEDUCED_REASON),
+        ])
+        self.assertEqual(histories.count(), 6)
+        self.assertEqual(histories[0].reason_object, self.lesson)
+
+
+class RelationsVersionTest(TestCase):
+    def setUp(self):
+        self.skill, self.prerequisite = [Skill.objects.create(code=x, name=x, description=x) for x in ("S1", "S0")]
+        self.student = Student.objects.create(user=User.objects.create(username="student"))
+        StudentSkill.objects.create(student=self.student, skill=self.skill, tested=timezone.now())
+        StudentSkill.objects.create(student=self.student, skill=self.prerequisite, tested=timezone.now())
+
+    def test_changed_by_another_process(self):
+        self.assertEqual(list(get_skill_graph().all_prerequisites(self.skill.id)), [])
+
+        # saved without signals, as seen from a process which did not handle them
+        Relations.objects.bulk_create([Relations(from_skill=self.skill, to_skill=self.prerequisite,
+                                                 relation_type="depend_on")])
+        self.assertEqual(list(get_skill_graph().all_prerequisites(self.skill.id)), [])
+
+        RelationsVersion.increase()
+        self.assertEqual(list(get_skill_graph().all_prerequisites(self.skill.id)), [self.prerequisite.id])
+
+    def test_equivalence_changed_by_another_process(self):
+        self.assertEqual(get_skill_equivalence().identic_skills(self.skill.id), {self.skill.id})
+
+        Relations.objects.bulk_create([Relations(from_skill=self.skill, to_skill=self.prerequisite,
+                                                 relation_type="identic_to")])
+        RelationsVersion.increase()
+        self.assertEqual(get_skill_equivalence().identic_skills(self.skill.id), {self.skill.id, self.prerequisite.id})
+
+    def test_recommended_skills(self):
+        self.assertEqual(self.student.get_recommended_skill_ids(), {self.skill.id, self.prerequisite.id})
+
+        Relations.objects.create(from_skill=self.skill, to_skill=self.prerequisite, relation_type="depend_on")
+        self.assertEqual(Student.objects.get(pk=self.student.pk).get_recommended_skill_ids(), {self.prerequisite.id})
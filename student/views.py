@@ -1,6 +1,5 @@
 # encoding: utf-8
 
-import json
 
 from datetime import datetime
 
@@ -10,14 +9,15 @@ from django.http import HttpResponseRedirect
 from django.core.urlresolvers import reverse
 from django.views.decorators.http import require_POST
 from django.db import transaction
-from django.db.models import Q
 
 # from examinations import generation
-from examinations.models import TestStudent, Answer, TestExercice
-from skills.models import StudentSkill, Skill, Section, CodeR, Relations, CodeR_relations
+from examinations.models import TestStudent, Answer
+from examinations.rendering import render_exercice
+from skills.models import StudentSkill, Skill, Section, CodeR
 from end_test_poll.models import StudentPoll
 from end_test_poll.forms import StudentPollForm
-from resources.models import KhanAcademy, Sesamath, Resource
+from resources.listing import get_resource_listing
+from resources.models import Sesamath
 from student_collaboration.models import StudentCollaborator
 from users.models import Student
 
@@ -75,9 +75,7 @@ def pass_test(request, pk):
             "collaborative_tool": student_collaborator.collaborative_tool
         })
 
-    # the order_by here is used to make the order of the exercices deterministics
-    # so each student will have the exercices in the same order
-    next_not_answered_test_exercice = TestExercice.objects.filter(test=test_student.test, exercice__isnull=False, testable_online=True).exclude(answer__in=test_student.answer_set.all()).order_by('created_at').first()
+    next_not_answered_test_exercice = test_student.get_next_test_exercice()
 
     if request.method == "POST":
         # There is normally no way for a student to answer another exercice
@@ -106,6 +104,7 @@ def pass_test(request, pk):
 
     return render(request, "examinations/take_exercice.haml", {
         "test_exercice": next_not_answered_test_exercice,
+        "rendered": render_exercice(next_not_answered_test_exercice.exercice),
     })
 
 
@@ -205,8 +204,8 @@ def validate_exercice(request, test_student, test_exercice):
             raw_answer[number]["correct"] = question.evaluate(raw_answer[number]["response"])
 
         # The Student answers are embedded in a list, in a way that they can be extended if needed
-        raw_answer = [raw_answer]
-        raw_answer = json.dumps(raw_answer, indent=4)
+        # The indexes are strings, as read back from the database
+        raw_answer = [{str(number): response for number, response in raw_answer.items()}]
 
     with transaction.atomic():
         answer = Answer.objects.create(
@@ -215,10 +214,12 @@ def validate_exercice(request, test_student, test_exercice):
             test_exercice=test_exercice,
         )
 
+        test_student.advance(test_exercice)
+
         # Evaluates the answer of the whole attached Context to assess the related Skill
         is_correct = answer.evaluate()
 
-        student_skill = StudentSkill.objects.get(student=request.user.student, skill=test_exercice.skill)
+        student_skill = StudentSkill.get_or_untested(request.user.student, test_exercice.skill)
 
         if is_correct == 1:
             student_skill.validate(
@@ -255,8 +256,7 @@ def start_test(request, pk):
             "test_student": test_student,
         })
 
-    test_student.started_at = datetime.now()
-    test_student.save()
+    test_student.start()
 
     return HttpResponseRedirect(reverse('student_pass_test', args=(test_student.pk,)))
 
@@ -286,239 +286,16 @@ def skill_pedagogic_ressources(request, type, slug):
         # type == 'coder'
         base = get_object_or_404(CodeR, id=slug)
 
-    personal_resource = base.resource.filter(section="personal_resource")
-    lesson_resource = base.resource.filter(section="lesson_resource")
-    exercice_resource = base.resource.filter(section="exercice_resource")
-    other_resource = base.resource.filter(section="other_resource")
-
-    exercice_resource_sesamath = list()
-    lesson_resource_sesamath = list()
-    lesson_resource_khanacademy = list()
-
-    sori_skills_lesson_resources = list()
-    sori_skills_exercice_resources = list()
-    sori_skills_other_resources = list()
-
-    sori_skills_lesson_resource_sesamath = list()
-    sori_skills_lesson_resource_khanacademy = list()
-    sori_skills_exercice_resource_sesamath = list()
-
-    sori_coder_lesson_resources = list()
-    sori_coder_exercice_resources = list()
-    sori_coder_other_resources = list()
-
-    sori_coder_lesson_resource_sesamath = list()
-    sori_coder_lesson_resource_khanacademy = list()
-    sori_coder_exercice_resource_sesamath = list()
-
-    # Sorting the different type of resources by category (personal, lesson, exercice or other)
-    # and by type (khanacademy, sesamath or other)
-
-    for exo in lesson_resource:
-        if exo.content.get('from') and exo.content['from'] == "skills_sesamathskill":
-            resource = get_object_or_404(Sesamath, pk=exo.content['referenced'])
-            lesson_resource_sesamath.append([exo.pk, resource])
-            lesson_resource = lesson_resource.exclude(pk=exo.pk)
-
-        elif exo.content.get('from') and exo.content['from'] == "skills_khanacademyvideoskill":
-            resource = get_object_or_404(KhanAcademy, pk=exo.content['referenced'])
-            lesson_resource_khanacademy.append([exo.pk, resource])
-            lesson_resource = lesson_resource.exclude(pk=exo.pk)
-
-    for exo in exercice_resource:
-        if exo.content.get('from') and exo.content['from'] == "skills_sesamathskill":
-            resource = get_object_or_404(Sesamath, pk=exo.content['referenced'])
-            exercice_resource_sesamath.append([exo.pk, resource])
-            exercice_resource = exercice_resource.exclude(pk=exo.pk)
-
-    # Do the same operation for similar or identical resources :
-    # Some Skill or CodeR can be similar or identical to other Skill or CodeR
-    # We have to display the resources of those as well
-
-    # We achieve this only if we have either a Skill or a CodeR.
-    # If it is a Section, we don't display the similar/identical resources
-    # First step : is base a Skill or a CodeR ?
-    if isinstance(base, Skill):
-        # Begin with the Skills, same step is done for CodeR a bit further
-
-        # Retrieve all the similar and identical Relations for Skills
-        skills_from = Relations.objects.filter(Q(relation_type__in=['similar_to', 'identic_to'], from_skill=base.id))
-        skills_to = Relations.objects.filter(Q(relation_type__in=['similar_to', 'identic_to'], to_skill=base.id))
-
-        # This list will gather all the similar or 'identic' Skills
-        # (similar_or_identic = sori)
-        sori_skills = list()
-        for skill_from in skills_from:
-            sori_skills.append(skill_from.to_skill)
-        for skill_to in skills_to:
-            sori_skills.append(skill_to.from_skill)
-
-        # Get the associated resources for these Skills
-        # We need to keep them separated by section to ease their use in the template
-
-        for skill in sori_skills:
-            lesson = skill.resource.filter(section="lesson_resource")
-            if lesson:
-                sori_skills_lesson_resources.append([skill, lesson])
-            exercice = skill.resource.filter(section="exercice_resource")
-            if exercice:
-                sori_skills_exercice_resources.append([skill, exercice])
-            other = skill.resource.filter(section="other_resource")
-            if other:
-                sori_skills_other_resources.append([skill, other])
-
-        # sori_skills_lesson_resources has resources of different types, we need to distinguish them
-        for skill in sori_skills_lesson_resources:
-            # Lists to regroup resources together
-            sesamath_list = list()
-            khan_list = list()
-
-            for res in skill[1]:
-                if res.content.get('from') and res.content['from'] == "skills_sesamathskill":
-                    resource = get_object_or_404(Sesamath, pk=res.content['referenced'])
-                    sesamath_list.append([res.pk, resource])
-                    skill[1] = skill[1].exclude(pk=res.pk)
-
-                elif res.content.get('from') and res.content['from'] == "skills_khanacademyvideoskill":
-                    resource = get_object_or_404(KhanAcademy, pk=res.content['referenced'])
-                    khan_list.append([res.pk, resource])
-                    skill[1] = skill[1].exclude(pk=res.pk)
-
-            # If we have emptied the ressources in the Skill, we remove it from the list
-            if not skill[1]:
-                sori_skills_lesson_resources.remove(skill)
-
-            # Once resources are sorted, we can add them with the associated Skill
-            if sesamath_list:
-                sori_skills_lesson_resource_sesamath.append([skill[0], sesamath_list])
-            if khan_list:
-                sori_skills_lesson_resource_khanacademy.append([skill[0], khan_list])
-
-        # sori_skills_exercice_resources has resources of different types, we need to distinguish them
-        for skill in sori_skills_exercice_resources:
-            # List to regroup resources together
-            sesamath_list = list()
-
-            for res in skill[1]:
-                if res.content.get('from') and res.content['from'] == "skills_sesamathskill":
-                    resource = get_object_or_404(Sesamath, pk=res.content['referenced'])
-                    sesamath_list.append([res.pk, resource])
-                    skill[1] = skill[1].exclude(pk=res.pk)
-
-            # If we have emptied the ressources in the Skill, we remove it from the list
-            if not skill[1]:
-                sori_skills_exercice_resources.remove(skill)
-
-            # Once resources are sorted, we can add them with the associated Skill
-            if sesamath_list:
-                sori_skills_exercice_resource_sesamath.append([skill[0], sesamath_list])
-
-    if isinstance(base, CodeR) or isinstance(base, Skill):
-        # Repeat this operation for the CodeR
-        # TODO : Group these steps as a function for Skill and CodeR
-        # Retrieve all the CodeR related to the current Skill or to the current CodeR
-
-        if isinstance(base, Skill):
-            related_coder = CodeR.objects.filter(skill=base.id)
-        else:
-            coder_from = CodeR_relations.objects.filter(
-                Q(relation_type__in=['similar_to', 'identic_to'], from_coder=base.id))
-            coder_to = CodeR_relations.objects.filter(
-                Q(relation_type__in=['similar_to', 'identic_to'], to_coder=base.id))
-
-            # This list will gather all the similar or 'identic' CodeR
-            related_coder = list()
-            for coder_from in coder_from:
-                related_coder.append(coder_from.to_coder)
-            for coder_to in coder_to:
-                related_coder.append(coder_to.from_coder)
-                # Case where we look for CodeR similar or identic to a CodeR
-
-        # Get the associated resources for these CodeR
-
-        for coder in related_coder:
-            lesson = coder.resource.filter(section="lesson_resource")
-            if lesson:
-                sori_coder_lesson_resources.append([coder, lesson])
-            exercice = coder.resource.filter(section="exercice_resource")
-            if exercice:
-                sori_coder_exercice_resources.append([coder, exercice])
-            other = coder.resource.filter(section="other_resource")
-            if other:
-                sori_coder_other_resources.append([coder, other])
-
-        # sori_skills_lesson_resources has resources of different types, we need to distinguish them
-        for coder in sori_coder_lesson_resources:
-            # Lists to regroup resources together
-            sesamath_list = list()
-            khan_list = list()
-
-            for res in coder[1]:
-                if res.content.get('from') and res.content['from'] == "skills_sesamathskill":
-                    resource = get_object_or_404(Sesamath, pk=res.content['referenced'])
-                    sesamath_list.append([res.pk, resource])
-                    coder[1] = coder[1].exclude(pk=res.pk)
-
-                elif res.content.get('from') and res.content['from'] == "skills_khanacademyvideoskill":
-                    resource = get_object_or_404(KhanAcademy, pk=res.content['referenced'])
-                    khan_list.append([res.pk, resource])
-                    coder[1] = coder[1].exclude(pk=res.pk)
-
-            # If we have emptied the ressources in the Skill, we remove it from the list
-            if not coder[1]:
-                sori_coder_lesson_resources.remove(coder)
-
-            # Once resources are sorted, we can add them with the associated Skill
-            if sesamath_list:
-                sori_coder_lesson_resource_sesamath.append([coder[0], sesamath_list])
-            if khan_list:
-                sori_coder_lesson_resource_khanacademy.append([coder[0], khan_list])
-
-        # sori_coder_exercice_resources has resources of different types, we need to distinguish them
-        for coder in sori_coder_exercice_resources:
-            # List to regroup resources together
-            sesamath_list = list()
-
-            for res in coder[1]:
-                if res.content.get('from') and res.content['from'] == "skills_sesamathskill":
-                    resource = get_object_or_404(Sesamath, pk=res.content['referenced'])
-                    sesamath_list.append([res.pk, resource])
-                    coder[1] = coder[1].exclude(pk=res.pk)
-
-            # If we have emptied the ressources in the CodeR, we remove it from the list
-            if not coder[1]:
-                sori_coder_exercice_resources.remove(coder)
-
-            # Once resources are sorted, we can add them with the associated CodeR
-            if sesamath_list:
-                sori_coder_exercice_resource_sesamath.append([coder[0], sesamath_list])
-
-
     sesamath_references_manuals = Sesamath.objects.filter(ressource_kind__iexact="Manuel")
     sesamath_references_cahiers = Sesamath.objects.filter(ressource_kind__iexact="Cahier")
 
-    return render(request, "professor/skill/update_pedagogical_resources.haml", {
+    context = {
         "sesamath_references_manuals": sesamath_references_manuals,
         "sesamath_references_cahier": sesamath_references_cahiers,
         "base": base,
-        "personal_resources": personal_resource,
-        "other_resources": other_resource,
-        "exercice_resources": exercice_resource,
-        "exercice_resource_sesamath": exercice_resource_sesamath,
-        "lesson_resources": lesson_resource,
-        "lesson_resource_sesamath": lesson_resource_sesamath,
-        "lesson_resource_khanacademy": lesson_resource_khanacademy,
         "type": type,
-        "sori_skills_exercice_resources": sori_skills_exercice_resources,
-        "sori_skills_lesson_resources": sori_skills_lesson_resources,
-        "sori_skills_other_resources": sori_skills_other_resources,
-        "sori_skills_lesson_resource_sesamath": sori_skills_lesson_resource_sesamath,
-        "sori_skills_lesson_resource_khanacademy": sori_skills_lesson_resource_khanacademy,
-        "sori_skills_exercice_resource_sesamath": sori_skills_exercice_resource_sesamath,
-        "sori_coder_exercice_resources": sori_coder_exercice_resources,
-        "sori_coder_lesson_resources": sori_coder_lesson_resources,
-        "sori_coder_other_resources": sori_coder_other_resources,
-        "sori_coder_lesson_resource_sesamath": sori_coder_lesson_resource_sesamath,
-        "sori_coder_lesson_resource_khanacademy": sori_coder_lesson_resource_khanacademy,
-        "sori_coder_exercice_resource_sesamath": sori_coder_exercice_resource_sesamath,
-    })
+    }
+    # the Resources of base and of the related Skills or CodeR, by section and by type
+    context.update(get_resource_listing(base))
+
+    return render(request, "professor/skill/update_pedagogical_resources.haml", context)
@@ -7,6 +7,7 @@ from django.db.models import Q
 from forum.models import Thread
 from users.models import Student
 from skills.models import SkillHistory, Skill
+from skills.signals import skill_histories_created
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from datetime import datetime
@@ -214,6 +215,22 @@ class HelpRequest(models.Model):
                 for closed in helprequest_to_be_closed.all():
                     closed.close_request(close_category=HelpRequest.HAS_OBTAINED_SKILLS)
 
+    """ Signal : Same as above, for the SkillHistory rows created in bulk by the skill propagation """
+
+    @receiver(skill_histories_created, sender=SkillHistory)
+    def check_status_in_bulk(sender, histories, **kwargs):
+        acquired = Q()
+        for history in histories:
+            if history.value == 'acquired':
+                acquired |= Q(student=history.student_id, skill=history.skill_id)
+
+        if not acquired:
+            return
+
+        helprequest_to_be_closed = HelpRequest.objects.filter(acquired).exclude(state=HelpRequest.CLOSED).distinct()
+        for closed in helprequest_to_be_closed:
+            closed.close_request(close_category=HelpRequest.HAS_OBTAINED_SKILLS)
+
     """ Signal : When the student disables the collaborative tool """
     @receiver(post_save, sender=StudentCollaborator)
     def close_help_requests_when_flag_off(sender, instance, **kwargs):
@@ -1,3 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from examinations.grid import parse_grid, fill_test_from_class
+from examinations.models import TestFromClass, TestSkillFromClass
+from promotions.models import Lesson, Stage
+from skills.models import Skill, SkillHistory, StudentSkill, Relations
+from users.models import Student
+
+
+class FillTestFromClassTest(TestCase):
+    def setUp(self):
+        # skill depends on prerequisite
+        self.skill = Skill.objects.create(code="S1", name="S1", description="S1")
+        self.prerequisite = Skill.objects.create(code="S0", name="S0", description="S0")
+        Relations.objects.create(from_skill=self.skill, to_skill=self.prerequisite, relation_type="depend_on")
+
+        stage = Stage.objects.create(name="Stage", level=1)
+        stage.skills.add(self.skill, self.prerequisite)
+
+        self.who = User.objects.create(username="professor")
+        self.student = Student.objects.create(user=User.objects.create(username="student"))
+        lesson = Lesson.objects.create(name="Lesson", stage=stage)
+        lesson.students.add(self.student)
+
+        self.test = TestFromClass.objects.create(name="Test", lesson=lesson)
+
+    def fill(self, *values):
+        fill_test_from_class(self.test, parse_grid(
+            ["%s_%s_%s" % (result, self.student.id, skill.id) for result, skill in values]), self.who)
+
+    def status(self, skill):
+        return StudentSkill.objects.get(student=self.student, skill=skill).get_status()
+
+    def test_parse_grid(self):
+        self.assertEqual(parse_grid(["good_1_2", "form_type", "bad_1_3", "unknown_1_2"]), [
+            ("bad", 1, 3),
+            ("unknown", 1, 2),
+        ])
+
+    def test_professor_input_wins(self):
+        # the propagation of each cell changes the other one, the results are the ones entered
+        self.fill(("good", self.skill), ("bad", self.prerequisite))
+
+        self.assertEqual(self.status(self.skill), "acquired")
+        self.assertEqual(self.status(self.prerequisite), "not acquired")
+        self.assertEqual(SkillHistory.objects.filter(reason="Évaluation libre (seconde passe)").count(), 2)
+
+    def test_results_recorded_once(self):
+        self.fill(("good", self.skill))
+        self.fill(("bad", self.skill), ("unknown", self.prerequisite))
+
+        self.assertEqual(dict(TestSkillFromClass.objects.filter(test=self.test).values_list("skill_id", "result")), {
+            self.skill.id: "bad",
+            self.prerequisite.id: "unknown",
+        })
+        self.assertEqual(TestSkillFromClass.objects.filter(test=self.test).count(), 2)
+        self.assertEqual(StudentSkill.objects.filter(student=self.student).count(), 2)
+
+    def test_unknown_ids(self):
+        cells = [("good", self.student.id, self.skill.id), ("good", self.student.id + 1, self.skill.id)]
+        with self.assertRaises(ValueError):
+            fill_test_from_class(self.test, cells, self.who)
+
+        with self.assertRaises(ValueError):
+            fill_test_from_class(self.test, [("bad", self.student.id, self.skill.id + 100)], self.who)
+
+        self.assertFalse(TestSkillFromClass.objects.exists())
+        self.assertFalse(StudentSkill.objects.exists())
@@ -8,3 +8,10 @@ from promotions.cbgv import LessonMixin
 class TestDetailView(LessonMixin, DetailView):
     model = Test
     template_name = "professor/lesson/test/online/detail.haml"
+
+    def get_context_data(self, **kwargs):
+        context = super(TestDetailView, self).get_context_data(**kwargs)
+
+        context["test_exercices"] = list(self.object.get_test_exercices_with_questions())
+
+        return context
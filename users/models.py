@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.db import models
+from django.db import models, transaction
 import random
 from django.db.models import Count
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.contrib.postgres.fields import ArrayField
+
+from skills.signals import student_skills_changed
 
 
 class AuthUserManager(models.Manager):
@@ -35,12 +40,22 @@ class Student(models.Model):
     is_pending = models.BooleanField(default=True)
     code = models.IntegerField(null=True, blank=True)
     code_created_at = models.DateTimeField(auto_now=True)
+    recommended_skills_cache = ArrayField(models.IntegerField(), null=True, blank=True)
+    """The ids of the Skills recommended to learn, None when they have to be computed again"""
 
     def __unicode__(self):
         return ("%s %s" % (
         self.user.first_name, self.user.last_name)) if self.user.first_name or self.user.last_name else self.user.username
 
 
+    def save(self, *args, **kwargs):
+        # the recommended Skills are only written by get_recommended_skill_ids, not from an instance maybe outdated
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [x.name for x in self._meta.concrete_fields
+                                       if not x.primary_key and x.name != "recommended_skills_cache"]
+
+        super(Student, self).save(*args, **kwargs)
+
     def generate_new_code(self):
         """Generate studenty password"""
         new_code = "%s" % (random.randint(1000, 9999))
@@ -66,9 +81,47 @@ class Student(models.Model):
     def get_last_test(self):
         return self.teststudent_set.order_by('-test__created_at').first()
 
+    def get_recommended_skill_ids(self):
+        """Get the ids of the Skills recommended to learn, computed once and stored until a Skill changes
+
+        All the tested and not acquired Skills are recommended, except if one
+        of their prerequisites is also tested and not acquired.
+        """
+        if self.recommended_skills_cache is None:
+            from skills.graph import get_skill_graph
+
+            # the Student is locked while computing: a change of its Skills is either committed before and read
+            # here, or resets the cache after this write (see reset_recommended_skills)
+            with transaction.atomic():
+                self.recommended_skills_cache = Student.objects.select_for_update().filter(pk=self.pk).values_list(
+                    "recommended_skills_cache", flat=True).first()
+
+                if self.recommended_skills_cache is None:
+                    not_acquired = self.studentskill_set.filter(
+                        acquired__isnull=True, tested__isnull=False).values_list("skill_id", flat=True)
+
+                    self.recommended_skills_cache = sorted(get_skill_graph().recommended(not_acquired))
+                    Student.objects.filter(pk=self.pk, recommended_skills_cache__isnull=True).update(
+                        recommended_skills_cache=self.recommended_skills_cache)
+
+        return set(self.recommended_skills_cache)
+
+    def recommended_skills(self):
+        """Get the Skills recommended to learn, see get_recommended_skill_ids"""
+        from skills.models import Skill
+
+        return Skill.objects.filter(id__in=self.get_recommended_skill_ids()).order_by("code")
+
     def has_recommended_skills(self):
-        for student_skill in self.studentskill_set.all():
-            if student_skill.recommended_to_learn():
-                return True
+        return bool(self.get_recommended_skill_ids())
+
+
+@receiver(student_skills_changed)
+def reset_recommended_skills(sender, transitions, **kwargs):
+    Student.objects.filter(pk__in={x[0] for x in transitions}).update(recommended_skills_cache=None)
+
 
-        return False
+@receiver(post_save, sender="skills.Relations")
+@receiver(post_delete, sender="skills.Relations")
+def reset_all_recommended_skills(sender, **kwargs):
+    Student.objects.filter(recommended_skills_cache__isnull=False).update(recommended_skills_cache=None)